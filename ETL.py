@@ -2,17 +2,51 @@ import pandas as pd
 import numpy as np
 import requests
 import json
-from io import BytesIO
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
+from schema import COLUNAS_ORDENADAS, COLUNAS_CONTROLE, aplicar_schema, preparar_para_dashboard
+from snapshot import publicar_snapshot
+from cubo import construir_tabelas_derivadas
 import os
 import time
+import random
+import hashlib
+import tempfile
+import threading
+import openpyxl
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
 
-def get_data():
+# Diretório onde o ETL guarda o estado entre execuções (watermark e último relatório bom)
+ETL_STATE_DIR = os.getenv('ETL_STATE_DIR', '.etl_cache')
+# Intervalo, em dias, entre as reconciliações completas do relatório do Pipefy
+DIAS_RECONCILIACAO = int(os.getenv('ETL_DIAS_RECONCILIACAO', '7'))
+# Margem aplicada ao watermark para não perder cards atualizados no limite da última execução
+MARGEM_WATERMARK = pd.Timedelta(hours=1)
+# Fuso horário das datas do relatório do Pipefy (sem fuso no arquivo). O watermark é guardado e enviado em UTC,
+# que é o fuso usado pelo Pipefy no filtro de 'updated_at'
+FUSO_RELATORIO = os.getenv('ETL_FUSO_RELATORIO', 'America/Sao_Paulo')
+# Acompanhamento do job de exportação: intervalo inicial e máximo entre consultas e prazo total (segundos)
+INTERVALO_INICIAL_EXPORTACAO = 1
+INTERVALO_MAXIMO_EXPORTACAO = 15
+PRAZO_EXPORTACAO = int(os.getenv('ETL_PRAZO_EXPORTACAO', '600'))
+# Validade, em dias, do cache local da Base23 (depois disso o conteúdo é lido novamente).
+# O cache é usado apenas nas execuções incrementais: as extrações completas sempre leem a aba
+DIAS_VALIDADE_BASE23 = int(os.getenv('ETL_DIAS_VALIDADE_BASE23', '7'))
+# Número máximo de células enviadas por requisição ao Google Sheets
+MAX_CELULAS_POR_LOTE = 20000
+# Tamanho dos blocos (bytes) usados no download do relatório
+TAMANHO_BLOCO_DOWNLOAD = 1024 * 1024
+# Aba da planilha onde o ETL publica a versão dos dados enviados à aba 'Upload' (lida pelos dashboards e pelo back-end)
+ABA_VERSAO = 'Versao'
+
+def get_data(desde=None, parar=None):
+    # parar (threading.Event, opcional): quando sinalizado, o acompanhamento da exportação é interrompido
+    # e a função retorna None (usado por extrair_fontes quando a outra fonte falha)
+
     # Acessa as variáveis de ambiente
     mytoken = os.getenv('PIPEFY_TOKEN')
     PipeID = os.getenv('PIPE_ID')
@@ -24,9 +58,14 @@ def get_data():
         'Content-Type': 'application/json'
     }
 
+    # No modo incremental, exporta apenas os cards atualizados desde o watermark
+    filtro = ''
+    if desde is not None:
+        filtro = f', filter: {{operator: "and", queries: [{{field: "updated_at", operator: "gte", value: "{desde.isoformat()}"}}]}}'
+
     mutation = f"""
     mutation {{
-        exportPipeReport(input: {{pipeId: {PipeID}, pipeReportId: {PipeReportID}}}) {{
+        exportPipeReport(input: {{pipeId: {PipeID}, pipeReportId: {PipeReportID}{filtro}}}) {{
             pipeReportExport {{
                 id
             }}
@@ -49,64 +88,166 @@ def get_data():
         return None
 
     export_id = response_json['data']['exportPipeReport']['pipeReportExport']['id']
-    
-    # Query GraphQL
-    query = f"""
-    {{
-        pipeReportExport(id: "{export_id}") {{
-            fileURL
-            state
-            startedAt
-            requestedBy {{
-                id
-            }}
-        }}
-    }}
-    """
-
-    time.sleep(15)
-
-    download_response = requests.post(url, json={'query': query}, headers=headers)
-
-    time.sleep(15)
-
-    # Verifica se a segunda requisição foi bem-sucedida
-    if download_response.status_code != 200:
-        print(f"Erro na segunda requisição: Status {download_response.status_code}")
-        print("Resposta:", download_response.text)
-        return None
+    inicio_pedido = time.monotonic()
+    pedido_em = pd.Timestamp.now(tz='UTC')  # Horário do pedido, comparável aos horários informados pelo Pipefy
 
-    download_response_json = download_response.json()
-    # Verifica se 'data' e 'pipeReportExport' existem na resposta
-    if 'data' not in download_response_json or 'pipeReportExport' not in download_response_json['data']:
-        print("Resposta inesperada da API na segunda requisição:", download_response_json)
+    # Acompanha o job de exportação até o arquivo ficar disponível
+    file_url = aguardar_exportacao(url, headers, export_id, inicio_pedido, pedido_em, parar)
+    if file_url is None or (parar is not None and parar.is_set()):
         return None
 
-    # file_url = download_response_json['data']['pipeReportExport']['fileURL']
-
     print('----- file_url -----')
     # print(file_url) # Print para debug
 
-    r = requests.get(download_response_json['data']['pipeReportExport']['fileURL'], allow_redirects=True)
-    # r = requests.get(file_url, allow_redirects=True)
-    data = r.content
-
-    print('----- data -----')
-    print(data) # Print para debug
-    
+    caminho = None
     try:
-        relatorio = pd.read_excel(BytesIO(data), engine='openpyxl')  # Lê o arquivo Excel
+        # Baixa o arquivo em blocos para um arquivo temporário e lê apenas as colunas usadas na base
+        caminho = baixar_relatorio(file_url)
+        relatorio = ler_relatorio(caminho)
         print('----- relatorio -----')
         print(relatorio)
-        # rela = pd.read_excel(file_url, engine='openpyxl')
-        print('----- rela -----')
-        # print(rela)
         return relatorio
     except Exception as e:
         print("Erro na extração:", e)
         return None
+    finally:
+        if caminho is not None and os.path.exists(caminho):
+            os.remove(caminho)
+
+def baixar_relatorio(file_url):
+    # Faz o download do relatório em blocos para um arquivo temporário, sem manter o conteúdo em memória
+    with requests.get(file_url, allow_redirects=True, stream=True) as r:
+        r.raise_for_status()
+        arquivo = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+        try:
+            with arquivo:
+                for bloco in r.iter_content(chunk_size=TAMANHO_BLOCO_DOWNLOAD):
+                    arquivo.write(bloco)
+        except BaseException:
+            # Download interrompido: o arquivo parcial é apagado aqui, já que quem chamou não recebe o caminho
+            os.remove(arquivo.name)
+            raise
+    return arquivo.name
+
+def ler_relatorio(caminho):
+    # Lê a primeira aba do relatório linha a linha (modo somente leitura do openpyxl),
+    # guardando apenas as colunas listadas em COLUNAS_EXTRACAO
+    workbook = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        # O Pipefy nem sempre grava as dimensões da planilha, o que faria o openpyxl truncar a leitura
+        worksheet.reset_dimensions()
+        linhas = worksheet.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return pd.DataFrame()
+
+        # Nomes repetidos recebem sufixo (.1, .2, ...), como no pd.read_excel
+        nomes = []
+        repeticoes = {}
+        for indice, nome in enumerate(cabecalho):
+            nome = f'Unnamed: {indice}' if nome is None else str(nome)
+            nomes.append(f'{nome}.{repeticoes[nome]}' if nome in repeticoes else nome)
+            repeticoes[nome] = repeticoes.get(nome, 0) + 1
+
+        indices = [indice for indice, nome in enumerate(nomes) if nome in COLUNAS_EXTRACAO]
+        colunas = {nomes[indice]: [] for indice in indices}
+        for linha in linhas:
+            # Ignora linhas totalmente vazias
+            if all(valor is None for valor in linha):
+                continue
+            for indice in indices:
+                colunas[nomes[indice]].append(linha[indice] if indice < len(linha) else None)
+    finally:
+        workbook.close()
+    return pd.DataFrame(colunas)
+
+def horario_servidor(valor):
+    # Converte um horário informado pelo Pipefy (ISO 8601) para UTC; None se ausente ou inválido
+    horario = pd.to_datetime(valor, errors='coerce') if valor else pd.NaT
+    if pd.isna(horario):
+        return None
+    return horario.tz_localize('UTC') if horario.tzinfo is None else horario.tz_convert('UTC')
+
+def tempos_exportacao(export, pedido_em, inicio_pedido, inicio_execucao, agora):
+    # Tempo (segundos) do job de exportação na fila e em execução. Usa os horários do servidor (startedAt e
+    # finishedAt) quando presentes; senão, a consulta em que o job foi visto em execução pela primeira vez
+    iniciado = horario_servidor(export.get('startedAt'))
+    if iniciado is not None:
+        concluido = horario_servidor(export.get('finishedAt')) or pd.Timestamp.now(tz='UTC')
+        # Diferenças de relógio entre a máquina e o servidor não geram tempos negativos
+        fila = max((iniciado - pedido_em).total_seconds(), 0)
+        return fila, max((concluido - iniciado).total_seconds(), 0)
+    return inicio_execucao - inicio_pedido, agora - inicio_execucao
+
+def aguardar_exportacao(url, headers, export_id, inicio_pedido, pedido_em, parar=None):
+    # Consulta o estado do job de exportação com backoff exponencial e jitter, até o prazo limite.
+    # Retorna a URL do arquivo assim que estiver disponível, ou None em caso de falha/prazo excedido
+    # ou quando o evento 'parar' é sinalizado (verificado durante cada espera entre as consultas).
+    query = f"""
+    {{
+        pipeReportExport(id: "{export_id}") {{
+            fileURL
+            state
+            startedAt
+            finishedAt
+        }}
+    }}
+    """
 
-def get_data_gsheet():
+    prazo = inicio_pedido + PRAZO_EXPORTACAO
+    intervalo = INTERVALO_INICIAL_EXPORTACAO
+    inicio_execucao = None  # Momento em que o job saiu da fila e começou a ser processado
+    estado = 'desconhecido'
+
+    while True:
+        # Espera o intervalo atual com jitter, sem ultrapassar o prazo
+        espera = min(random.uniform(intervalo / 2, intervalo), max(prazo - time.monotonic(), 0))
+        if parar is None:
+            time.sleep(espera)
+        elif parar.wait(espera):
+            print("Acompanhamento da exportação interrompido.")
+            return None
+
+        try:
+            # Cada consulta também respeita o prazo total (com um mínimo de 1s para a última consulta)
+            response = requests.post(url, json={'query': query}, headers=headers,
+                                     timeout=max(prazo - time.monotonic(), 1))
+            response_json = response.json() if response.status_code == 200 else None
+        except requests.RequestException as erro:
+            # Falhas de rede (conexão, timeout, resposta inválida) são tratadas como erros transitórios
+            print(f"Erro ao consultar a exportação: {erro}")
+            response = None
+        agora = time.monotonic()
+
+        if response is not None and response.status_code == 200:
+            export = (response_json.get('data') or {}).get('pipeReportExport')
+            if export is None:
+                print("Resposta inesperada da API ao consultar a exportação:", response_json)
+                return None
+
+            estado = (export.get('state') or '').lower()
+            if inicio_execucao is None and (export.get('startedAt') or export.get('fileURL')):
+                inicio_execucao = agora
+
+            if export.get('fileURL'):
+                fila, execucao = tempos_exportacao(export, pedido_em, inicio_pedido, inicio_execucao, agora)
+                print(f"Exportação concluída: {fila:.1f}s na fila, {execucao:.1f}s em execução.")
+                return export['fileURL']
+            if estado in ('failed', 'error'):
+                print(f"A exportação do relatório falhou (estado: {estado}).")
+                return None
+        elif response is not None:
+            # Erros transitórios da API não interrompem o acompanhamento do job
+            print(f"Erro ao consultar a exportação: Status {response.status_code}")
+
+        if agora >= prazo:
+            print(f"A exportação não foi concluída em {PRAZO_EXPORTACAO}s (último estado: {estado}).")
+            return None
+
+        intervalo = min(intervalo * 2, INTERVALO_MAXIMO_EXPORTACAO)
+
+def get_data_gsheet(usar_cache=True):
     credentials_str = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
     credentials = json.loads(credentials_str)
     
@@ -119,34 +260,100 @@ def get_data_gsheet():
     sheet = client.open_by_key(SheetsID)
     worksheet = sheet.worksheet('Base23')
 
+    # A Base23 (histórico de 2023) quase nunca muda: nas execuções incrementais, usa a cópia local enquanto
+    # a grade da aba não mudar. A chave não detecta células editadas dentro da grade, por isso as extrações
+    # completas (reconciliação periódica ou ETL_MODO=completo) ignoram o cache e leem a aba inteira
+    chave = f'{worksheet.id}:{worksheet.row_count}x{worksheet.col_count}'
+    cache = carregar_cache_base23(chave) if usar_cache else None
+    if cache is not None:
+        print("Base23 carregada do cache local.")
+        return cache
+
     # Lê os dados
     data = worksheet.get_all_values()
     headers = data.pop(0)
     df = pd.DataFrame(data, columns=headers)
+    # Datas da Base23 estão no formato dia/mês/ano
+    df = aplicar_schema(df, dayfirst=True)
+    relatar_falhas_conversao(df, 'Base23')
+    salvar_cache_base23(chave, [headers] + data, df)
     return df
-    
-# a partir daqui, todas as variaveis que estão sendo usadas são do tipo DataFrame
+
+def carregar_cache_base23(chave):
+    # Retorna a Base23 salva localmente se a chave da aba for a mesma e o cache ainda estiver no prazo
+    caminho = os.path.join(ETL_STATE_DIR, 'base23.json')
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho) as f:
+        metadados = json.load(f)
+    validado_em = pd.Timestamp(metadados['validado_em'])
+    if metadados['chave'] != chave or pd.Timestamp.now() - validado_em >= pd.Timedelta(days=DIAS_VALIDADE_BASE23):
+        return None
+    return pd.read_parquet(os.path.join(ETL_STATE_DIR, 'base23.parquet'))
+
+def salvar_cache_base23(chave, data, df):
+    # Salva a Base23 já tipada em formato colunar (Parquet), junto com a chave da aba e o hash do conteúdo.
+    # O hash só evita regravar o Parquet quando o conteúdo baixado não mudou (o download já foi feito).
+    os.makedirs(ETL_STATE_DIR, exist_ok=True)
+    caminho = os.path.join(ETL_STATE_DIR, 'base23.json')
+    conteudo_hash = hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()
+
+    metadados = {}
+    if os.path.exists(caminho):
+        with open(caminho) as f:
+            metadados = json.load(f)
+    if metadados.get('hash') != conteudo_hash:
+        df.to_parquet(os.path.join(ETL_STATE_DIR, 'base23.parquet'), index=False)
+
+    metadados = {'chave': chave, 'hash': conteudo_hash, 'validado_em': pd.Timestamp.now().isoformat()}
+    with open(caminho + '.tmp', 'w') as f:
+        json.dump(metadados, f)
+    os.replace(caminho + '.tmp', caminho)
+
+# Mapeamento das colunas do relatório em inglês para os nomes usados na base
+COLUNAS_ENG = {
+    'Title': 'Nome do cliente',
+    'Created at': 'Criado em',
+    'Current phase': 'Fase atual',
+    'Serviço': 'Checklist vertical',
+    'Total time in Base de prospects (days)': 'Tempo total na fase Base de prospects (dias)',
+    'Total time in Qualificação (days)': 'Tempo total na fase Qualificação (dias)',
+    'Total time in Diagnóstico (days)': 'Tempo total na fase Diagnóstico (dias)',
+    'Total time in Montagem de proposta (days)': 'Tempo total na fase Montagem de proposta (dias)',
+    'Total time in Apresentação de proposta (days)': 'Tempo total na fase Apresentação de proposta (dias)',
+    'Total time in Negociação (days)': 'Tempo total na fase Negociação (dias)',
+    'First time enter Ganho': 'Primeira vez que entrou na fase Ganho',
+    'Total time in Renegociação (days)': 'Tempo total na fase Renegociação (dias)',
+    'Code': 'Código',
+    'Updated at': 'Atualizado em',
+}
+
+# Mapeamento das colunas do relatório em português para os nomes usados na base
+COLUNAS_PTBR = {
+    'Título': 'Nome do cliente',
+    'Serviço': 'Checklist vertical',
+}
+
+# Colunas do relatório exportado que precisam ser lidas (nos dois idiomas)
+COLUNAS_EXTRACAO = set(COLUNAS_ORDENADAS) | set(COLUNAS_CONTROLE) | set(COLUNAS_ENG) | set(COLUNAS_PTBR)
+
 def rename_columns_ENG(relatorio):
-    relatorio.rename(columns={
-        'Title': 'Nome do cliente',
-        'Created at': 'Criado em',
-        'Current phase': 'Fase atual',
-        'Serviço': 'Checklist vertical',
-        'Total time in Base de prospects (days)': 'Tempo total na fase Base de prospects (dias)',
-        'Total time in Qualificação (days)': 'Tempo total na fase Qualificação (dias)',
-        'Total time in Diagnóstico (days)': 'Tempo total na fase Diagnóstico (dias)',
-        'Total time in Montagem de proposta (days)': 'Tempo total na fase Montagem de proposta (dias)',
-        'Total time in Apresentação de proposta (days)': 'Tempo total na fase Apresentação de proposta (dias)',
-        'Total time in Negociação (days)': 'Tempo total na fase Negociação (dias)',
-        'First time enter Ganho': 'Primeira vez que entrou na fase Ganho',
-        'Total time in Renegociação (days)': 'Tempo total na fase Renegociação (dias)',
-    }, inplace=True)
+    renomear_colunas(relatorio, COLUNAS_ENG)
         
 def rename_columns_PTBR(relatorio):
-    relatorio.rename(columns={
-    'Título': 'Nome do cliente',
-    'Serviço': 'Checklist vertical',
-    }, inplace=True)
+    renomear_colunas(relatorio, COLUNAS_PTBR)
+
+def renomear_colunas(relatorio, mapeamento):
+    # Renomeia as colunas do relatório. Se o nome novo já existir (ex.: 'Serviço' -> 'Checklist vertical',
+    # com o campo antigo 'Checklist vertical' ainda no relatório), as duas colunas viram uma só: vale o valor
+    # da coluna renomeada e, nas linhas em que ela está vazia, o da coluna que já existia
+    for origem, destino in mapeamento.items():
+        if origem in relatorio.columns and destino in relatorio.columns:
+            renomeada = relatorio[origem]
+            vazia = renomeada.isna() | (renomeada.astype(str).str.strip() == '')
+            relatorio[destino] = renomeada.where(~vazia, relatorio[destino])
+            relatorio.drop(columns=origem, inplace=True)
+    relatorio.rename(columns=mapeamento, inplace=True)
 
 def reorganize_columns(relatorio):
     # Reorganiza as colunas
@@ -155,73 +362,178 @@ def reorganize_columns(relatorio):
         rename_columns_ENG(relatorio)
     elif 'Título' in relatorio.columns:
         rename_columns_PTBR(relatorio)
-    else:
+    elif 'Nome do cliente' not in relatorio.columns:
         print("Colunas não encontradas.")
         return relatorio
     # Reordenando as colunas com base na ordem de origem
-    colunas_ordenadas = [
-        'Fase atual',
-        'Criado em',
-        'Nome do cliente',
-        'Empresa',
-        'Responsável',
-        'Perfil de cliente',
-        'Setor',
-        'Checklist vertical',
-        'Origem',
-        'Valor Final',
-        'Motivo da perda',
-        'Motivo da não qualificação',
-        'Tempo total na fase Base de prospects (dias)',
-        'Tempo total na fase Qualificação (dias)',
-        'Tempo total na fase Diagnóstico (dias)',
-        'Tempo total na fase Montagem de proposta (dias)',
-        'Tempo total na fase Apresentação de proposta (dias)',
-        'Tempo total na fase Negociação (dias)',
-        'Primeira vez que entrou na fase Ganho',
-        'Tempo total na fase Renegociação (dias)'
-    ]
+    colunas_controle = [coluna for coluna in COLUNAS_CONTROLE if coluna in relatorio.columns]
 
-    relatorio = relatorio[colunas_ordenadas]
+    relatorio = relatorio[COLUNAS_ORDENADAS + colunas_controle]
     return relatorio
 
 
 def type_fix(relatorio):
-    # Convertendo colunas para os tipos corretos
-    relatorio['Criado em'] = relatorio['Criado em'].astype(object)
-    relatorio['Primeira vez que entrou na fase Ganho'] = relatorio['Primeira vez que entrou na fase Ganho'].astype(object)
-    relatorio['Tempo total na fase Base de prospects (dias)'] = relatorio['Tempo total na fase Base de prospects (dias)'].astype(object)
-    relatorio['Tempo total na fase Qualificação (dias)'] = relatorio['Tempo total na fase Qualificação (dias)'].astype(object)
-    relatorio['Tempo total na fase Diagnóstico (dias)'] = relatorio['Tempo total na fase Diagnóstico (dias)'].astype(object)
-    relatorio['Tempo total na fase Montagem de proposta (dias)'] = relatorio['Tempo total na fase Montagem de proposta (dias)'].astype(object)
-    relatorio['Tempo total na fase Apresentação de proposta (dias)'] = relatorio['Tempo total na fase Apresentação de proposta (dias)'].astype(object)
-    relatorio['Primeira vez que entrou na fase Ganho'] = relatorio['Primeira vez que entrou na fase Ganho'].astype(object)
-    relatorio['Tempo total na fase Negociação (dias)'] = relatorio['Tempo total na fase Negociação (dias)'].astype(object)
+    # Convertendo colunas para os tipos definidos no schema da base.
+    # O relatório do Pipefy é exportado em pt-BR: datas com barra estão no formato dia/mês/ano
+    relatorio = aplicar_schema(relatorio, dayfirst=True)
+    relatar_falhas_conversao(relatorio, 'relatório do Pipefy')
     return relatorio
 
-def treat_data(relatorio):
+def relatar_falhas_conversao(df, fonte):
+    # Mostra quantos valores de cada coluna não puderam ser convertidos para o tipo do schema
+    for coluna, total in df.attrs.get('falhas_conversao', {}).items():
+        print(f"{fonte}: {total} valor(es) da coluna '{coluna}' não puderam ser convertidos.")
+
+def extrair_fontes(desde=None):
+    # Executa a exportação do Pipefy e a leitura da aba Base23 em paralelo.
+    # Nas extrações completas (desde=None), a Base23 é lida da aba, sem o cache local.
+    # Retorna (relatorio, base23, tempos), com o tempo em segundos de cada fonte.
+    # Se qualquer uma das fontes falhar, a exceção é propagada sem esperar a outra terminar, e a exportação
+    # do Pipefy em andamento é interrompida na próxima espera entre as consultas (evento 'parar').
+    tempos = {}
+    parar = threading.Event()
+
+    def cronometrar(nome, funcao, *args):
+        inicio = time.monotonic()
+        resultado = funcao(*args)
+        tempos[nome] = time.monotonic() - inicio
+        if resultado is None:
+            raise RuntimeError(f"Não foi possível extrair a fonte '{nome}'.")
+        return resultado
+
+    inicio = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=2)
+    futuros = {
+        executor.submit(cronometrar, 'pipefy', get_data, desde, parar): 'pipefy',
+        executor.submit(cronometrar, 'base23', get_data_gsheet, desde is not None): 'base23',
+    }
+    try:
+        concluidos, _ = wait(futuros, return_when=FIRST_EXCEPTION)
+        for futuro in concluidos:
+            # Relança a primeira falha imediatamente
+            futuro.result()
+        resultados = {futuros[futuro]: futuro.result() for futuro in futuros}
+    except BaseException:
+        # O cancel_futures abaixo não interrompe uma tarefa já em execução: a exportação para pelo evento
+        parar.set()
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    tempos['total'] = time.monotonic() - inicio
+    print(f"Extração concluída em {tempos['total']:.1f}s "
+          f"(Pipefy: {tempos['pipefy']:.1f}s, Base23: {tempos['base23']:.1f}s).")
+    return resultados['pipefy'], resultados['base23'], tempos
+
+def treat_data(relatorio, base23=None):
     # Trata os dados
-    base23 = get_data_gsheet()
+    if base23 is None:
+        base23 = get_data_gsheet()
     relatorio = reorganize_columns(relatorio)
     relatorio = type_fix(relatorio)
-    base_completa = pd.concat([relatorio, base23])
-    # Converter 'Criado em' para datetime e Ordenar por data
-    base_completa['Criado em'] = pd.to_datetime(base_completa['Criado em'], errors='coerce', dayfirst=True)
-    base_completa = base_completa.sort_values(by='Criado em')
+    # Mescla as fontes sem duplicar cards (o relatório do Pipefy tem precedência sobre a Base23)
+    # e mantém a base ordenada por data
+    base_completa = mesclar_fontes([relatorio, base23])
 
-    # Preenchendo valores NaN com strings vazias
-    atualizada = base_completa.fillna('')
+    # Reaplica o schema (a concatenação de categorias diferentes volta para object).
+    # Valores ausentes viram strings vazias apenas na hora do upload para o Google Sheets
+    atualizada = aplicar_schema(base_completa)
     return atualizada
 
+def texto_chave(df, coluna):
+    # Texto normalizado (sem espaços nas pontas, em minúsculas) usado na identificação dos cards; ausentes viram ''
+    if coluna not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[coluna].astype('string').fillna('').str.strip().str.lower()
+
+def identificar_cards(df):
+    # Identifica cada linha pelo 'Código' do card (NaN se ausente, ex.: cards da Base23) e por um hash (uint64)
+    # do nome do cliente, da empresa e da data de criação, válido apenas quando os três estão preenchidos
+    if 'Código' in df.columns:
+        codigos = pd.to_numeric(df['Código'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    else:
+        codigos = np.full(len(df), np.nan)
+    identificacao = pd.DataFrame({
+        'nome': texto_chave(df, 'Nome do cliente'),
+        'empresa': texto_chave(df, 'Empresa'),
+        'criado_em': pd.to_datetime(df['Criado em'], errors='coerce', dayfirst=True) if 'Criado em' in df.columns else pd.NaT,
+    }, index=df.index)
+    validas = ((identificacao['nome'] != '') & (identificacao['empresa'] != '') & identificacao['criado_em'].notna()).to_numpy()
+    chaves = pd.util.hash_pandas_object(identificacao, index=False).to_numpy()
+    return codigos, chaves, validas
+
+def ordenar_particao(df, coluna):
+    # Ordena a partição pela coluna apenas se ela ainda não estiver ordenada (datas vazias no final)
+    valores = df[coluna]
+    if valores.dropna().is_monotonic_increasing and not valores.isna().iloc[:valores.notna().sum()].any():
+        return df
+    return df.sort_values(by=coluna, kind='mergesort')
+
+def concatenar(partes):
+    # Concatena apenas as partes não vazias (o pandas avisa sobre partes vazias na concatenação)
+    nao_vazias = [parte for parte in partes if len(parte)]
+    if not nao_vazias:
+        return partes[0].iloc[0:0].reset_index(drop=True)
+    return pd.concat(nao_vazias, ignore_index=True)
+
+def intercalar_ordenados(a, b, coluna):
+    # Intercala duas partições já ordenadas pela coluna, sem reordenar tudo de novo.
+    # Em caso de empate, as linhas de 'a' vêm antes; datas vazias ficam no final.
+    vazios_a = a[coluna].isna().to_numpy()
+    vazios_b = b[coluna].isna().to_numpy()
+    a_validos, b_validos = a[~vazios_a], b[~vazios_b]
+
+    # Posição final de cada linha de 'b' = quantas linhas de 'a' vêm antes dela + sua posição em 'b'
+    posicoes_b = np.searchsorted(a_validos[coluna].to_numpy(), b_validos[coluna].to_numpy(), side='right') + np.arange(len(b_validos))
+    de_b = np.zeros(len(a_validos) + len(b_validos), dtype=bool)
+    de_b[posicoes_b] = True
+    ordem = np.empty(len(de_b), dtype=np.int64)
+    ordem[~de_b] = np.arange(len(a_validos))
+    ordem[de_b] = len(a_validos) + np.arange(len(b_validos))
+
+    intercalado = concatenar([a_validos, b_validos]).iloc[ordem]
+    return concatenar([intercalado, a[vazios_a], b[vazios_b]])
+
+def mesclar_fontes(particoes, coluna_ordem='Criado em'):
+    # Mescla as partições (em ordem de precedência) mantendo uma única linha por card. O resultado fica
+    # ordenado pela coluna_ordem. Uma linha é descartada apenas quando:
+    # - tem 'Código' e o mesmo código já apareceu antes (na mesma partição ou em uma anterior);
+    # - não tem 'Código' (ex.: Base23) e o nome do cliente, a empresa e a data de criação, todos preenchidos,
+    #   coincidem com os de uma linha mantida de uma partição anterior.
+    # Linhas sem código e com algum desses campos vazio são sempre mantidas, como na concatenação simples.
+    identificacoes = [identificar_cards(particao) for particao in particoes]
+
+    # Remove os códigos repetidos em uma única passada sobre todas as partições
+    codigos = np.concatenate([codigos for codigos, _, _ in identificacoes])
+    com_codigo = ~np.isnan(codigos)
+    manter = np.ones(len(codigos), dtype=bool)
+    manter[com_codigo] = ~pd.Index(codigos[com_codigo]).duplicated(keep='first')
+
+    resultado = None
+    inicio = 0
+    chaves_anteriores = np.empty(0, dtype='uint64')
+    for particao, (codigos_particao, chaves, validas) in zip(particoes, identificacoes):
+        fim = inicio + len(particao)
+        manter_particao = manter[inicio:fim]
+        # Linhas sem código que correspondem a um card de uma partição anterior
+        sem_codigo = np.isnan(codigos_particao) & validas
+        manter_particao[sem_codigo & np.isin(chaves, chaves_anteriores)] = False
+        chaves_anteriores = np.concatenate([chaves_anteriores, chaves[manter_particao & validas]])
+        inicio = fim
+
+        parte = ordenar_particao(particao[manter_particao], coluna_ordem)
+        resultado = parte if resultado is None else intercalar_ordenados(resultado, parte, coluna_ordem)
+    return resultado.reset_index(drop=True)
+
 def UploadDataToGSheet(df):
     try:
         # Verifica se o DataFrame não está vazio
         if df.empty:
             print("O DataFrame está vazio. Nenhum dado será carregado para o Google Sheets.")
-            return
+            return False
 
-        # Converte objetos Timestamp para string
-        df = df.applymap(lambda x: x.strftime('%Y-%m-%d %H:%M:%S') if isinstance(x, pd.Timestamp) else x)
+        # Converte o DataFrame para as linhas que serão gravadas (cabeçalho + dados)
+        linhas = serializar_linhas(df)
 
         credentials_json = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
         credentials_dict = json.loads(credentials_json)
@@ -234,20 +546,61 @@ def UploadDataToGSheet(df):
         SheetsID = os.getenv('SHEETS_ID')
         if not SheetsID:
             print("SheetsID não foi encontrado nas variáveis de ambiente.")
-            return
+            return False
 
         # Abre a planilha
         sheet = client.open_by_key(SheetsID)
         worksheet = sheet.worksheet('Upload')
 
-        # Limpa a planilha
-        worksheet.clear()
-
-        # Atualiza a planilha com os dados obtidos
-        worksheet.update([df.columns.values.tolist()] + df.values.tolist())
-        print("Dados carregados com sucesso para o Google Sheets.")
+        # Lê o conteúdo atual (valores sem formatação, para comparar números como números)
+        atuais = worksheet.get_all_values(value_render_option='UNFORMATTED_VALUE')
+        resumir_diferencas(atuais, linhas)
+
+        # Garante que a aba comporta a largura dos novos dados antes de escrever
+        n_colunas = len(linhas[0])
+        if n_colunas > worksheet.col_count:
+            worksheet.add_cols(n_colunas - worksheet.col_count)
+
+        # Envia apenas as linhas que mudaram, em lotes de tamanho limitado,
+        # sem nunca limpar a aba que está sendo lida pelo Power BI e pelos dashboards
+        removidas = []
+        if mesmo_cabecalho(atuais, linhas):
+            # Cada card é comparado com a sua linha atual na aba: os alterados são atualizados no lugar,
+            # os removidos têm a linha apagada e os novos são adicionados ao final
+            blocos, removidas, novas = planejar_alteracoes(atuais, linhas)
+            enviar_blocos(worksheet, blocos)
+            remover_linhas(worksheet, removidas)
+            total_linhas = len(atuais) - len(removidas)
+            if novas:
+                linhas_grade = worksheet.row_count - len(removidas)
+                if total_linhas + len(novas) > linhas_grade:
+                    worksheet.resize(rows=total_linhas + len(novas))
+                enviar_blocos(worksheet, [(total_linhas, novas)])
+                blocos.append((total_linhas, novas))
+        else:
+            # Cabeçalho diferente (colunas novas ou reordenadas): compara linha a linha pela posição
+            if len(linhas) > worksheet.row_count:
+                worksheet.add_rows(len(linhas) - worksheet.row_count)
+            blocos = calcular_blocos_alterados(atuais, linhas)
+            enviar_blocos(worksheet, blocos)
+
+        # Limpa apenas as linhas e colunas que sobraram além dos novos dados
+        total_atual = len(atuais) - len(removidas)
+        largura_atual = max((len(linha) for linha in atuais), default=0)
+        intervalos_sobra = []
+        if total_atual > len(linhas):
+            intervalos_sobra.append(f'A{len(linhas) + 1}:{gspread.utils.rowcol_to_a1(total_atual, max(largura_atual, n_colunas))}')
+        if largura_atual > n_colunas:
+            inicio = gspread.utils.rowcol_to_a1(1, n_colunas + 1)
+            intervalos_sobra.append(f'{inicio}:{gspread.utils.rowcol_to_a1(max(total_atual, len(linhas)), largura_atual)}')
+        if intervalos_sobra:
+            worksheet.batch_clear(intervalos_sobra)
+
+        print(f"Dados carregados com sucesso para o Google Sheets ({sum(len(bloco) for _, bloco in blocos)} linhas enviadas, "
+              f"{len(removidas)} removidas).")
 
         #obs. A planilha que está sendo atualizada é a que está alimentando o POWER BI
+        return True
 
     # Tratamento de exceções    
     except FileNotFoundError:
@@ -256,21 +609,250 @@ def UploadDataToGSheet(df):
         print(f"A planilha com o ID {SheetsID} não foi encontrada.")
     except Exception as e:
         print(f"Ocorreu um erro durante o upload dos dados: {e}")
+    return False
+
+def publicar_versao_planilha(manifesto):
+    # Publica na aba ABA_VERSAO a versão dos dados da aba 'Upload'. O ETL roda no runner do GitHub Actions,
+    # então o snapshot local não chega às máquinas dos dashboards: elas comparam esta versão com a do seu
+    # snapshot local e, quando muda, leem a aba 'Upload' e gravam o snapshot da nova versão (ver utils.py)
+    try:
+        credentials_dict = json.loads(os.getenv('GOOGLE_SHEETS_CREDENTIALS'))
+        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
+        sheet = gspread.authorize(creds).open_by_key(os.getenv('SHEETS_ID'))
+        try:
+            worksheet = sheet.worksheet(ABA_VERSAO)
+        except gspread.exceptions.WorksheetNotFound:
+            worksheet = sheet.add_worksheet(title=ABA_VERSAO, rows=2, cols=3)
+        worksheet.update(
+            [['versao', 'linhas', 'publicado_em'], [manifesto['versao'], manifesto['linhas'], manifesto['criado_em']]],
+            'A1:C2',
+            value_input_option='RAW',
+        )
+        return True
+    except Exception as e:
+        print(f"Não foi possível publicar a versão na planilha: {e}")
+        return False
+
+def serializar_linhas(df):
+    # Converte o DataFrame em uma lista de linhas (cabeçalho + dados) pronta para o Google Sheets:
+    # datas viram texto e valores ausentes viram strings vazias
+    df = df.copy()
+    for coluna in df.columns[df.dtypes.map(pd.api.types.is_datetime64_any_dtype)]:
+        df[coluna] = df[coluna].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df = df.astype(object).where(df.notna(), '')
+    df = df.map(lambda x: x.strftime('%Y-%m-%d %H:%M:%S') if isinstance(x, pd.Timestamp) else x)
+    return [df.columns.values.tolist()] + df.values.tolist()
+
+def calcular_blocos_alterados(atuais, linhas):
+    # Compara linha a linha (pela posição) o conteúdo atual da aba com as novas linhas e agrupa as linhas
+    # alteradas em blocos contíguos. Retorna uma lista de (índice da primeira linha, linhas do bloco).
+    largura = len(linhas[0])
+    alteradas = []
+    for indice, linha in enumerate(linhas):
+        if indice >= len(atuais) or completar_linha(atuais[indice], largura) != linha:
+            alteradas.append((indice, linha))
+    return agrupar_blocos(alteradas)
+
+def completar_linha(linha, largura):
+    # Ajusta uma linha lida da aba à largura dos novos dados (o Sheets omite as células vazias do final)
+    return (list(linha) + [''] * largura)[:largura]
+
+def agrupar_blocos(alteradas):
+    # Agrupa pares (índice da linha, linha), ordenados pelo índice, em blocos de linhas contíguas
+    blocos = []
+    for indice, linha in alteradas:
+        if blocos and blocos[-1][0] + len(blocos[-1][1]) == indice:
+            blocos[-1][1].append(linha)
+        else:
+            blocos.append((indice, [linha]))
+    return blocos
+
+def mesmo_cabecalho(atuais, linhas):
+    # A comparação por card exige a coluna 'Código' e as colunas na mesma ordem na aba e nos novos dados
+    return bool(atuais) and 'Código' in linhas[0] and completar_linha(atuais[0], len(linhas[0])) == linhas[0]
+
+def chaves_linhas(cabecalho, linhas):
+    # Chave de cada linha de dados: o 'Código' do card ou, sem código (ex.: cards da Base23), o nome do cliente,
+    # a empresa e a data de criação. Chaves repetidas são diferenciadas pela ordem de ocorrência
+    indice_codigo = cabecalho.index('Código')
+    indices_card = [cabecalho.index(coluna) for coluna in ['Nome do cliente', 'Empresa', 'Criado em'] if coluna in cabecalho]
+    ocorrencias = {}
+    chaves = []
+    for linha in linhas:
+        linha = completar_linha(linha, len(cabecalho))
+        if linha[indice_codigo] != '':
+            chave = ('Código', str(linha[indice_codigo]))
+        else:
+            chave = tuple(str(linha[indice]) for indice in indices_card)
+        ocorrencia = ocorrencias.get(chave, 0)
+        ocorrencias[chave] = ocorrencia + 1
+        chaves.append((chave, ocorrencia))
+    return chaves
+
+def planejar_alteracoes(atuais, linhas):
+    # Associa cada card dos novos dados à sua linha atual na aba (pela chave de chaves_linhas).
+    # Retorna (blocos de linhas alteradas, atualizadas no lugar; índices das linhas removidas; linhas novas)
+    largura = len(linhas[0])
+    posicoes = {chave: indice for indice, chave in enumerate(chaves_linhas(linhas[0], atuais[1:]), start=1)}
+    alteradas = []
+    novas = []
+    for chave, linha in zip(chaves_linhas(linhas[0], linhas[1:]), linhas[1:]):
+        indice = posicoes.pop(chave, None)
+        if indice is None:
+            novas.append(linha)
+        elif completar_linha(atuais[indice], largura) != linha:
+            alteradas.append((indice, linha))
+    alteradas.sort(key=lambda par: par[0])
+    return agrupar_blocos(alteradas), sorted(posicoes.values()), novas
+
+def remover_linhas(worksheet, indices):
+    # Apaga as linhas da aba (índices a partir de 0) em uma única requisição, de baixo para cima,
+    # para que a remoção de um intervalo não desloque os seguintes
+    requisicoes = [
+        {'deleteDimension': {'range': {
+            'sheetId': worksheet.id, 'dimension': 'ROWS', 'startIndex': inicio, 'endIndex': inicio + len(bloco),
+        }}}
+        for inicio, bloco in reversed(agrupar_blocos([(indice, None) for indice in indices]))
+    ]
+    if requisicoes:
+        worksheet.spreadsheet.batch_update({'requests': requisicoes})
+
+def enviar_blocos(worksheet, blocos):
+    # Envia os blocos alterados com batch_update, limitando o número de células por requisição
+    largura = len(blocos[0][1][0]) if blocos else 0
+    linhas_por_lote = max(MAX_CELULAS_POR_LOTE // max(largura, 1), 1)
+    lote = []
+    celulas_lote = 0
+    for inicio, bloco in blocos:
+        # Divide blocos muito grandes em partes menores que o limite do lote
+        for deslocamento in range(0, len(bloco), linhas_por_lote):
+            parte = bloco[deslocamento:deslocamento + linhas_por_lote]
+            if celulas_lote + len(parte) * largura > MAX_CELULAS_POR_LOTE and lote:
+                worksheet.batch_update(lote, value_input_option='RAW')
+                lote, celulas_lote = [], 0
+            primeira = inicio + deslocamento + 1
+            intervalo = f'A{primeira}:{gspread.utils.rowcol_to_a1(primeira + len(parte) - 1, largura)}'
+            lote.append({'range': intervalo, 'values': parte})
+            celulas_lote += len(parte) * largura
+    if lote:
+        worksheet.batch_update(lote, value_input_option='RAW')
+
+def resumir_diferencas(atuais, linhas):
+    # Mostra quantos cards foram adicionados, atualizados ou removidos, comparando pela coluna 'Código'
+    if 'Código' not in linhas[0] or not atuais or 'Código' not in atuais[0]:
+        return
+    indice_novo = linhas[0].index('Código')
+    indice_atual = atuais[0].index('Código')
+    atuais_por_codigo = {linha[indice_atual]: linha for linha in atuais[1:] if indice_atual < len(linha) and linha[indice_atual] != ''}
+    novos_por_codigo = {linha[indice_novo]: linha for linha in linhas[1:] if linha[indice_novo] != ''}
+    adicionados = len(novos_por_codigo.keys() - atuais_por_codigo.keys())
+    removidos = len(atuais_por_codigo.keys() - novos_por_codigo.keys())
+    atualizados = sum(
+        1 for codigo in novos_por_codigo.keys() & atuais_por_codigo.keys()
+        if dict(zip(atuais[0], atuais_por_codigo[codigo])) != dict(zip(linhas[0], novos_por_codigo[codigo]))
+    )
+    print(f"Cards: {adicionados} novos, {atualizados} atualizados, {removidos} removidos.")
+
+def carregar_estado():
+    # Lê o estado salvo pela última execução bem-sucedida (watermark e data da última reconciliação)
+    caminho = os.path.join(ETL_STATE_DIR, 'estado.json')
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho) as f:
+        return json.load(f)
+
+def salvar_estado(estado, relatorio):
+    # Salva o relatório mesclado e o estado apenas depois de um upload bem-sucedido
+    os.makedirs(ETL_STATE_DIR, exist_ok=True)
+    relatorio.to_parquet(os.path.join(ETL_STATE_DIR, 'relatorio.parquet'), index=False)
+    caminho = os.path.join(ETL_STATE_DIR, 'estado.json')
+    # Escreve em um arquivo temporário e substitui, para não deixar um estado pela metade
+    with open(caminho + '.tmp', 'w') as f:
+        json.dump(estado, f)
+    os.replace(caminho + '.tmp', caminho)
+
+def carregar_relatorio_anterior():
+    # Lê o último relatório bom (já reorganizado) salvo pelo ETL, se existir
+    caminho = os.path.join(ETL_STATE_DIR, 'relatorio.parquet')
+    if not os.path.exists(caminho):
+        return None
+    return pd.read_parquet(caminho)
+
+def definir_watermark(estado, relatorio_anterior):
+    # Decide se a execução será incremental (retorna o watermark) ou completa (retorna None)
+    if os.getenv('ETL_MODO') == 'completo' or relatorio_anterior is None or 'watermark' not in estado:
+        return None
+    if 'Código' not in relatorio_anterior.columns:
+        print("O relatório anterior não possui a coluna 'Código'. Executando extração completa.")
+        return None
+    ultima_reconciliacao = pd.Timestamp(estado.get('ultima_reconciliacao', '1970-01-01'))
+    if pd.Timestamp.now() - ultima_reconciliacao >= pd.Timedelta(days=DIAS_RECONCILIACAO):
+        print("Reconciliação periódica: executando extração completa.")
+        return None
+    return para_utc(pd.Timestamp(estado['watermark'])) - MARGEM_WATERMARK
+
+def para_utc(horario):
+    # Converte um horário para UTC; horários sem fuso (datas do relatório ou watermark salvo por versões
+    # anteriores) são interpretados no fuso do relatório
+    if horario.tzinfo is None:
+        horario = horario.tz_localize(FUSO_RELATORIO, ambiguous=True, nonexistent='shift_forward')
+    return horario.tz_convert('UTC')
+
+def mesclar_incremental(relatorio_anterior, delta):
+    # Substitui os cards do relatório anterior pelas versões atualizadas e adiciona os cards novos
+    if delta.empty:
+        return relatorio_anterior
+    return aplicar_schema(mesclar_fontes([delta, relatorio_anterior]))
+
+def calcular_watermark(relatorio):
+    # Maior valor de 'Atualizado em' do relatório, em UTC e com o fuso no texto (None se a coluna não existir)
+    if 'Atualizado em' not in relatorio.columns:
+        return None
+    atualizado_em = pd.to_datetime(relatorio['Atualizado em'], errors='coerce').max()
+    return None if pd.isnull(atualizado_em) else para_utc(atualizado_em).isoformat()
 
 
 
 def ETLPipefy():
-    # Chama a função para obter o relatório
-    relatorio = get_data()
+    # Decide entre extração incremental (a partir do watermark) e completa
+    estado = carregar_estado()
+    relatorio_anterior = carregar_relatorio_anterior()
+    desde = definir_watermark(estado, relatorio_anterior)
+    if desde is not None:
+        print(f"Extração incremental: cards atualizados desde {desde}.")
+
+    # Obtém o relatório do Pipefy e a Base23 em paralelo
+    try:
+        relatorio, base23, _ = extrair_fontes(desde)
+    except Exception as e:
+        print("Não foi possível extrair o relatório:", e)
+        return
     print(relatorio) # Print para debug
-    # Verifica se o relatório foi carregado corretamente e salva como Excel
-    if relatorio is not None:
-        #relatorio.to_excel('teste.xlsx', index=False) <--- Comentei para não salvar o arquivo
-        print("Relatório salvo com sucesso.")
-    else:
-        print("Não foi possível extrair o relatório.")
+    #relatorio.to_excel('teste.xlsx', index=False) <--- Comentei para não salvar o arquivo
+    relatorio = type_fix(reorganize_columns(relatorio))
+
+    # No modo incremental, mescla os cards alterados ao último relatório bom
+    if desde is not None:
+        if 'Código' not in relatorio.columns:
+            print("O relatório incremental não possui a coluna 'Código'. Executando extração completa.")
+            relatorio = get_data()
+            if relatorio is None:
+                print("Não foi possível extrair o relatório.")
+                return
+            relatorio = type_fix(reorganize_columns(relatorio))
+            desde = None
+        else:
+            relatorio = mesclar_incremental(relatorio_anterior, relatorio)
+
+    novo_estado = {
+        'watermark': calcular_watermark(relatorio) or estado.get('watermark'),
+        'ultima_reconciliacao': pd.Timestamp.now().isoformat() if desde is None else estado.get('ultima_reconciliacao'),
+    }
+    relatorio_mesclado = relatorio
+
     # Trata os dados
-    relatorio = treat_data(relatorio)
+    relatorio = treat_data(relatorio, base23)
     # Verifica se o relatório foi carregado corretamente e salva como Excel
     if relatorio is not None:
         #relatorio.to_excel('base_completa.xlsx', index=False) <--- Comentei para não salvar o arquivo
@@ -278,6 +860,16 @@ def ETLPipefy():
     else:
         print("Não foi possível extrair o relatório.")
     #upa as base atualizada para o Google Sheets
-    UploadDataToGSheet(relatorio)
+    if UploadDataToGSheet(relatorio):
+        # Publica também o snapshot local (lido diretamente quando o ETL roda na máquina dos dashboards), junto com
+        # os cubos agregados usados nos gráficos e as tabelas ponte de vendedores e serviços
+        extras = construir_tabelas_derivadas(preparar_para_dashboard(relatorio))
+        manifesto = publicar_snapshot(relatorio, extras=extras)
+        print(f"Snapshot {manifesto['versao']} publicado ({manifesto['linhas']} linhas, cubo com {len(extras['cubo'])} linhas).")
+        # A versão vai para a planilha só depois do upload completo, para que quem a leia encontre os dados dela
+        publicar_versao_planilha(manifesto)
+        # Só avança o watermark quando os dados chegaram ao Google Sheets
+        if novo_estado['watermark'] is not None:
+            salvar_estado(novo_estado, relatorio_mesclado)
 
 
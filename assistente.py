@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+import openai
+import pandas as pd
+
+from travas import trava_arquivo
+
+# Registro do assistant da OpenAI usado pelo back-end (back.py) e do arquivo com a base enviado a ele.
+# O par (file_id, assistant_id) fica gravado em um JSON local junto com a impressão digital da base
+# (e da configuração do assistant). Enquanto ela não muda, os processos reaproveitam o mesmo par, sem
+# enviar a base nem criar um assistant novo; quando muda, um único processo cria o par novo.
+# Os pares substituídos ficam listados em 'anteriores' no registro e só são apagados depois de CARENCIA_ASSISTENTE
+# segundos sem perguntas em andamento neste processo, para que as execuções iniciadas com eles terminem normalmente.
+
+# Arquivo do registro
+ARQUIVO_REGISTRO = os.getenv('CRM_REGISTRO_ASSISTENTE', os.path.join('data', 'assistente.json'))
+# Arquivo CSV com a base enviado ao assistant
+ARQUIVO_CSV = 'dados_oportunidades.csv'
+# Tempo (em segundos) que um assistant substituído é mantido antes de ser apagado. Deve ser maior que o tempo
+# máximo de uma execução e que o intervalo de atualização dos processos, que podem ainda estar usando o antigo
+CARENCIA_ASSISTENTE = int(os.getenv('CRM_CARENCIA_ASSISTENTE', '600'))
+
+# Registro do assistant usado pelas novas perguntas deste processo
+_ativo = {'registro': None}
+# Quantidade de perguntas em andamento neste processo em cada assistant: assistant_id -> quantidade
+_em_uso = {}
+
+# Configuração do assistant (faz parte da impressão digital: se mudar, um assistant novo é criado)
+NOME_ASSISTENTE = 'Consultor CRM de vendas CITi'
+MODELO = 'gpt-4o-mini'
+INSTRUCOES = (
+    "Você deve usar os dados informados, que estão em csv, relativos às oportunidades de vendas do CITi para responder às perguntas."
+    "Colunas:"
+    "- Fase atual: Indica em qual fase do processo de vendas a oportunidade se encontra (Perdido, Renegociação, Ganho, Leads não-qualificados, Negociação, Montagem de proposta, Diagnóstico, Apresentação de proposta, Base de prospects, Qualificação)."
+    "- Data de cadastro: Data e hora em que a oportunidade foi registrada."
+    "- Nome do cliente: Nome da pessoa responsável pelo contato pelo lado do cliente."
+    "- Empresa: Nome da empresa do cliente."
+    "- Vendedor: Nome do colaborador da nossa empresa responsável pela oportunidade (vendedor responsável)."
+    "- Perfil de cliente: Tipo de cliente (Empresa consolidada, Startup, Empreendedor, Empresas Juniores, Grupo de pesquisa)."
+    "- Setor: Indústria ou setor em que o cliente atua (Energia e Sustentabilidade, Saúde e Cuidados Médicos, Ciências e Inovação, Transporte e Logística, Tecnologia da Informação (TI), entre outros)."
+    "- Checklist vertical: Tipo de serviço solicitado pelo cliente (Desenvolvimento Web, Concepção, Construção de API, entre outros)."
+    "Obs: Nesse campo de Checklist vertical pode aparecer mais de um tipo de serviço junto (para o caso do cliente querer mais de uma coisa)."
+    "- Origem: Canal de origem do lead (Marketing, Indicação de Ej, UFPE, Indicação MEJ, Parcerias, Ex cliente, Comunidade CITi, Prospecção Ativa, CIn, Porto Digital, Membre do CITi, Eventos, Renegociação)."
+    "- Valor Final: Valor final da proposta."
+    "- Motivo da perda: Razão pela qual a oportunidade foi perdida, se aplicável."
+    "- Motivo da não qualificação: Razão pela qual o lead não foi qualificado, se aplicável."
+    "- Tempo total na fase Base de prospects (dias): Quantidade de tempo que a oportunidade permaneceu na fase inicial."
+    "- Tempo total nas outras fases: Colunas que indicam o tempo em dias que a oportunidade permaneceu em cada uma das fases (qualificação, diagnóstico, montagem de proposta, apresentação, negociação, renegociação)."
+    "- Primeira vez que entrou na fase Ganho: Indica quando a oportunidade foi marcada como 'Ganho', caso tenha ocorrido."
+    "Essa estrutura permite acompanhar o andamento das oportunidades de venda e identificar potenciais gargalos no processo comercial."
+    "- Entenda vendas como vendas concluídas, ou seja oportunidades que foram ganhas e faturamento como soma das vendas concluídas."
+)
+
+
+def impressao_digital(df):
+    # SHA-256 dos valores e colunas da base e da configuração do assistant
+    sha256 = hashlib.sha256()
+    sha256.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    sha256.update(json.dumps([[str(coluna) for coluna in df.columns], NOME_ASSISTENTE, MODELO, INSTRUCOES]).encode())
+    return sha256.hexdigest()
+
+
+def ler_registro(caminho=ARQUIVO_REGISTRO):
+    """
+    Lê o registro do assistant atual.
+
+    Args:
+        caminho (str): Arquivo do registro.
+
+    Returns:
+        dict: {'impressao_digital', 'file_id', 'assistant_id', 'criado_em', 'anteriores'}, ou None se não existir.
+    """
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def gravar_registro(registro, caminho=ARQUIVO_REGISTRO):
+    # Grava o registro em um arquivo temporário e depois o substitui (os.replace é atômico)
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    with open(caminho + '.tmp', 'w') as f:
+        json.dump(registro, f)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def trava_registro(caminho=ARQUIVO_REGISTRO):
+    # Garante que apenas um processo por vez crie o assistant e atualize o registro
+    return trava_arquivo(caminho + '.lock')
+
+
+def criar_assistente(client, df):
+    """
+    Envia a base à OpenAI em CSV e cria um assistant com acesso a ela pelo code interpreter.
+
+    Args:
+        client (OpenAI): Client da OpenAI.
+        df (DataFrame): Base do CRM.
+
+    Returns:
+        dict: {'file_id', 'assistant_id'}.
+    """
+    df.to_csv(ARQUIVO_CSV, index=False)
+    with open(ARQUIVO_CSV, 'rb') as arquivo:
+        file = client.files.create(file=arquivo, purpose='assistants')
+    assistant = client.beta.assistants.create(
+        name=NOME_ASSISTENTE,
+        instructions=INSTRUCOES,
+        tools=[{'type': 'code_interpreter'}],  # O assistant usa o code interpreter para analisar o CSV
+        tool_resources={'code_interpreter': {'file_ids': [file.id]}},
+        model=MODELO
+    )
+    return {'file_id': file.id, 'assistant_id': assistant.id}
+
+
+def apagar_assistente(client, registro):
+    # Apaga o assistant e o arquivo de um registro antigo. Retorna True se os dois não existem mais (itens já
+    # apagados, ex.: por outro processo ou em uma tentativa anterior, contam como apagados)
+    try:
+        for apagar, identificador in [(client.beta.assistants.delete, registro['assistant_id']),
+                                      (client.files.delete, registro['file_id'])]:
+            try:
+                apagar(identificador)
+            except openai.NotFoundError:
+                pass
+        return True
+    except openai.OpenAIError as erro:
+        print(f"Não foi possível apagar o assistant {registro['assistant_id']}: {erro}")
+        return False
+
+
+def preparar_assistente(client, df):
+    """
+    Obtém o assistant da versão atual da base, criando-o apenas se a base (ou a configuração) mudou.
+
+    O assistant substituído não é apagado aqui: ele entra na lista 'anteriores' do registro e é
+    apagado depois, por coletar_assistentes_antigos.
+
+    Args:
+        client (OpenAI): Client da OpenAI.
+        df (DataFrame): Base do CRM.
+
+    Returns:
+        dict: Registro do assistant ({'impressao_digital', 'file_id', 'assistant_id', 'criado_em', 'anteriores'}).
+    """
+    impressao = impressao_digital(df)
+    registro = ler_registro()
+    if registro is not None and registro['impressao_digital'] == impressao:
+        return registro
+
+    with trava_registro():
+        # Outro processo pode ter criado o assistant enquanto este esperava a trava
+        registro = ler_registro()
+        if registro is not None and registro['impressao_digital'] == impressao:
+            return registro
+        novo = criar_assistente(client, df)
+        anteriores = []
+        if registro is not None:
+            anteriores = registro.get('anteriores', []) + [{
+                'file_id': registro['file_id'],
+                'assistant_id': registro['assistant_id'],
+                'substituido_em': time.time(),
+            }]
+        novo.update({'impressao_digital': impressao, 'criado_em': time.time(), 'anteriores': anteriores})
+        gravar_registro(novo)
+    return novo
+
+
+def coletar_assistentes_antigos(client, em_uso):
+    """
+    Apaga os assistants (e arquivos) substituídos há mais de CARENCIA_ASSISTENTE segundos.
+
+    Um registro antigo só sai da lista 'anteriores' depois que o assistant e o arquivo foram apagados;
+    os que falharem continuam nela e são tentados novamente na próxima passagem.
+
+    Args:
+        client (OpenAI): Client da OpenAI.
+        em_uso (set): IDs dos assistants com perguntas em andamento neste processo (não são apagados).
+
+    Returns:
+        int: Quantidade de assistants apagados.
+    """
+    registro = ler_registro()
+    if registro is None or not registro.get('anteriores'):
+        return 0
+
+    agora = time.time()
+    expirados = [
+        antigo for antigo in registro['anteriores']
+        if antigo['assistant_id'] not in em_uso and agora - antigo['substituido_em'] > CARENCIA_ASSISTENTE
+    ]
+    # As exclusões (requisições à OpenAI) são feitas fora da trava do registro
+    apagados = [antigo['assistant_id'] for antigo in expirados if apagar_assistente(client, antigo)]
+    if not apagados:
+        return 0
+
+    with trava_registro():
+        # Relê o registro, que pode ter mudado (ex.: um novo assistant substituído) durante as exclusões
+        registro = ler_registro()
+        if registro is not None:
+            registro['anteriores'] = [antigo for antigo in registro.get('anteriores', []) if antigo['assistant_id'] not in apagados]
+            gravar_registro(registro)
+    return len(apagados)
+
+
+def ativar_assistente(registro):
+    # Troca o assistant usado pelas novas perguntas; as que já começaram continuam com o anterior
+    _ativo['registro'] = registro
+
+
+def assistentes_em_uso():
+    # IDs do assistant ativo e dos assistants com perguntas em andamento neste processo
+    return set(_em_uso) | {_ativo['registro']['assistant_id']}
+
+
+@asynccontextmanager
+async def usar_assistente():
+    """
+    Fornece o assistant ativo durante uma pergunta, contando-a como em andamento nele.
+
+    Yields:
+        str: ID do assistant.
+    """
+    assistant_id = _ativo['registro']['assistant_id']
+    _em_uso[assistant_id] = _em_uso.get(assistant_id, 0) + 1
+    try:
+        yield assistant_id
+    finally:
+        _em_uso[assistant_id] -= 1
+        if not _em_uso[assistant_id]:
+            del _em_uso[assistant_id]
@@ -1,130 +1,260 @@
-from flask import Flask, request, jsonify
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
 import openai
+import uvicorn
 from dotenv import load_dotenv, find_dotenv
-import time
-from utils import carregar_base
-
-app = Flask(__name__) # Cria uma instância do Flask
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from utils import carregar_base_versao
+from conversas import usar_conversa
+from assistente import (preparar_assistente, ativar_assistente, usar_assistente, assistentes_em_uso,
+                        coletar_assistentes_antigos)
 
 MAX_TOKENS_OUTPUT = 500 # Define o número máximo de tokens que a resposta pode ter
+TIMEOUT_RESPOSTA = 100 # Tempo máximo (em segundos) de uma execução transmitida por /ask/stream
+# Eventos de execução que encerram a transmissão sem resposta completa
+EVENTOS_FALHA = ['thread.run.failed', 'thread.run.cancelled', 'thread.run.expired', 'thread.run.incomplete']
+# Intervalo (em segundos) entre as verificações de uma nova versão da base para o assistant
+INTERVALO_ATUALIZACAO = int(os.getenv('CRM_INTERVALO_ATUALIZACAO_ASSISTENTE', '300'))
 
-df = carregar_base() # Carrega a base de dados diretamente do Google Sheets
-
-# Salva o DataFrame como CSV temporariamente
-csv_file_path = 'dados_oportunidades.csv'  # Define o caminho do arquivo CSV
-df.to_csv(csv_file_path, index=False)  # Salva o DataFrame como CSV
+# Carrega a base de dados (snapshot local ou Google Sheets) e a sua versão, obtidas juntas para que a versão
+# registrada corresponda à base enviada ao assistant, mesmo que a base seja trocada em segundo plano
+df, versao_assistente = carregar_base_versao() # versao_assistente: versão da base enviada ao assistant ativo
 
 _ = load_dotenv(find_dotenv()) # Carrega variáveis de ambiente do arquivo .env, se existir
 
-client = openai.Client() # Cria uma instância do client da OpenAI
-
-# Faz o upload do arquivo para a API da OpenAI
-file = client.files.create(
-    file=open(csv_file_path, 'rb'), # Abre o arquivo CSV em modo leitura binária
-    purpose='assistants' # Define que o propósito do arquivo é para o assistant
-)
-file_id = file.id  # Salva o ID do arquivo
-
-# Cria o assistant na API da OpenAI
-assistant = client.beta.assistants.create(
-    name='Consultor CRM de vendas CITi',
-    instructions="Você deve usar os dados informados, que estão em csv, relativos às oportunidades de vendas do CITi para responder às perguntas."
-"Colunas:"
-"- Fase atual: Indica em qual fase do processo de vendas a oportunidade se encontra (Perdido, Renegociação, Ganho, Leads não-qualificados, Negociação, Montagem de proposta, Diagnóstico, Apresentação de proposta, Base de prospects, Qualificação)."
-"- Data de cadastro: Data e hora em que a oportunidade foi registrada."
-"- Nome do cliente: Nome da pessoa responsável pelo contato pelo lado do cliente."
-"- Empresa: Nome da empresa do cliente."
-"- Vendedor: Nome do colaborador da nossa empresa responsável pela oportunidade (vendedor responsável)."
-"- Perfil de cliente: Tipo de cliente (Empresa consolidada, Startup, Empreendedor, Empresas Juniores, Grupo de pesquisa)."
-"- Setor: Indústria ou setor em que o cliente atua (Energia e Sustentabilidade, Saúde e Cuidados Médicos, Ciências e Inovação, Transporte e Logística, Tecnologia da Informação (TI), entre outros)."
-"- Checklist vertical: Tipo de serviço solicitado pelo cliente (Desenvolvimento Web, Concepção, Construção de API, entre outros)."
-"Obs: Nesse campo de Checklist vertical pode aparecer mais de um tipo de serviço junto (para o caso do cliente querer mais de uma coisa)."
-"- Origem: Canal de origem do lead (Marketing, Indicação de Ej, UFPE, Indicação MEJ, Parcerias, Ex cliente, Comunidade CITi, Prospecção Ativa, CIn, Porto Digital, Membre do CITi, Eventos, Renegociação)."
-"- Valor Final: Valor final da proposta."
-"- Motivo da perda: Razão pela qual a oportunidade foi perdida, se aplicável."
-"- Motivo da não qualificação: Razão pela qual o lead não foi qualificado, se aplicável."
-"- Tempo total na fase Base de prospects (dias): Quantidade de tempo que a oportunidade permaneceu na fase inicial."
-"- Tempo total nas outras fases: Colunas que indicam o tempo em dias que a oportunidade permaneceu em cada uma das fases (qualificação, diagnóstico, montagem de proposta, apresentação, negociação, renegociação)."
-"- Primeira vez que entrou na fase Ganho: Indica quando a oportunidade foi marcada como 'Ganho', caso tenha ocorrido."
-"Essa estrutura permite acompanhar o andamento das oportunidades de venda e identificar potenciais gargalos no processo comercial."
-"- Entenda vendas como vendas concluídas, ou seja oportunidades que foram ganhas e faturamento como soma das vendas concluídas.",
-    tools=[{'type': 'code_interpreter'}], # Define que o assistant usará a ferramenta de interpretação de código
-    tool_resources={'code_interpreter': {'file_ids': [file_id]}}, # Associa o arquivo carregado à ferramenta de interpretação de código
-    model='gpt-4o-mini' # Especifica o modelo a ser utilizado
-)
-assistant_id = assistant.id # Salva o ID do assistant
-
-thread = client.beta.threads.create() # Cria uma nova thread para interação com o assistant
-thread_id = thread.id # Salva o ID da thread
+client = openai.Client() # Cria uma instância do client da OpenAI (usado na inicialização)
+# Client assíncrono usado nas requisições: as esperas não bloqueiam o processo, que atende várias perguntas ao mesmo tempo
+client_async = openai.AsyncOpenAI()
+
+# Obtém o assistant com a base atual: reaproveita o registrado localmente se a base não mudou (ver assistente.py)
+# e só envia o CSV e cria um assistant novo quando ela muda
+ativar_assistente(preparar_assistente(client, df))
+
+def verificar_base():
+    # Obtém a base em cache e a sua versão de uma só vez (a chamada também dispara a recarga em segundo plano
+    # se houver versão nova)
+    return carregar_base_versao()
+
+async def atualizar_assistente():
+    """
+    Verifica periodicamente se há uma nova versão da base e, se houver, troca o assistant das novas perguntas.
+
+    O envio do CSV e a criação do assistant rodam em uma thread, sem bloquear as requisições. As perguntas
+    em andamento terminam com o assistant com que começaram; os assistants substituídos são apagados
+    depois (ver assistente.coletar_assistentes_antigos).
+    """
+    global versao_assistente
+    while True:
+        await asyncio.sleep(INTERVALO_ATUALIZACAO)
+        try:
+            df, versao = await asyncio.to_thread(verificar_base)
+            if versao != versao_assistente:
+                ativar_assistente(await asyncio.to_thread(preparar_assistente, client, df))
+                versao_assistente = versao
+            await asyncio.to_thread(coletar_assistentes_antigos, client, assistentes_em_uso())
+        except Exception as erro:
+            print(f"Erro ao atualizar o assistant: {erro}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Mantém a atualização do assistant rodando em segundo plano enquanto o servidor estiver no ar
+    tarefa = asyncio.create_task(atualizar_assistente())
+    yield
+    tarefa.cancel()
 
 # Requisição para a API da OpenAI
-@app.route("/ask", methods=["POST"]) # Define a rota /ask que aceita requisições POST
-def ask_openai(): # Define a função que será chamada quando a rota for acessada
-    data = request.json # Obtém os dados da requisição no formato JSON
+async def ask_openai(request): # Define a função que será chamada quando a rota /ask for acessada
+    try:
+        data = await request.json() # Obtém os dados da requisição no formato JSON
+    except json.JSONDecodeError:
+        data = {} # Corpo ausente ou inválido é tratado como uma requisição sem pergunta
+    if not isinstance(data, dict): # O corpo precisa ser um objeto JSON (ex.: uma lista é rejeitada)
+        return JSONResponse({"error": "O corpo da requisição deve ser um objeto JSON"}, status_code=400)
     question = data.get("question", "") # Extrai a pergunta do JSON ou define com string vazia se a pergunta não existir
     
     if question: # Verifica se a pergunta não está vazia
-        # Adiciona mensagem à uma thread existente
-        message = client.beta.threads.messages.create(
-            thread_id=thread_id, # ID da thread que a mensagem será enviada
-            role='user', # Define o papel da mensagem como 'user'
-            content=question # Define o conteúdo da mensagem como a pergunta que foi obtida da requisição
-        )
-
-        # Cria uma nova execução para processar a pergunta
-        run = client.beta.threads.runs.create(
-            thread_id = thread_id, # ID da thread associada
-            assistant_id = assistant_id, # ID do assistant que irá responder
-            instructions='', # Instruções adicionais
-            max_completion_tokens=MAX_TOKENS_OUTPUT # Define o número máximo de tokens na resposta
-        )
-
-        start_time = time.time() # Armazena o horário atual para controle de timeout
-        timeout = 100  # Define um tempo máximo de execução em segundos
-        wait_time = 4  # Define um intervalo de espera entre cada verificação de status da execução em segundos
-
-        # Aguarda a thread rodar com limite de tempo
-        while run.status in ['queued', 'in_progress', 'cancelling']:
-            time.sleep(wait_time) # Espera o tempo definido antes de verificar o status novamente
-            # Recupera o status da execução
-            run = client.beta.threads.runs.retrieve(
+        # Usa a thread da sessão do Chat (criada na primeira pergunta); sessões diferentes rodam em paralelo
+        # O assistant ativo fica reservado até a pergunta terminar, mesmo que seja trocado no meio dela
+        async with usar_conversa(client_async, data.get("session_id")) as thread_id, usar_assistente() as assistant_id:
+            # Adiciona mensagem à thread da sessão
+            message = await client_async.beta.threads.messages.create(
+                thread_id=thread_id, # ID da thread que a mensagem será enviada
+                role='user', # Define o papel da mensagem como 'user'
+                content=question # Define o conteúdo da mensagem como a pergunta que foi obtida da requisição
+            )
+
+            # Cria uma nova execução para processar a pergunta
+            run = await client_async.beta.threads.runs.create(
                 thread_id = thread_id, # ID da thread associada
-                run_id = run.id # ID da execução
+                assistant_id = assistant_id, # ID do assistant que irá responder
+                instructions='', # Instruções adicionais
+                max_completion_tokens=MAX_TOKENS_OUTPUT # Define o número máximo de tokens na resposta
             )
 
-            # Verifica se o tempo de execução excedeu o timeout
-            if time.time() - start_time > timeout:
-                print('Tempo de execução excedido. Tente novamente mais tarde.')
-                break # Sai do loop
+            start_time = time.time() # Armazena o horário atual para controle de timeout
+            timeout = 100  # Define um tempo máximo de execução em segundos
+            wait_time = 4  # Define um intervalo de espera entre cada verificação de status da execução em segundos
 
-        # Verifica se a execução foi completada com sucesso
-        if run.status == 'completed':
-            # Lista todas as mensagens na thread
-            messages = client.beta.threads.messages.list(
-                thread_id = thread_id # ID da thread associada
-            )
+            excedeu_tempo = False # Indica se a execução foi interrompida por exceder o tempo máximo
+
+            # Aguarda a thread rodar com limite de tempo
+            while run.status in ['queued', 'in_progress', 'cancelling']:
+                # Espera o tempo definido antes de verificar o status novamente, liberando o processo para outras requisições
+                await asyncio.sleep(wait_time)
+                # Recupera o status da execução
+                run = await client_async.beta.threads.runs.retrieve(
+                    thread_id = thread_id, # ID da thread associada
+                    run_id = run.id # ID da execução
+                )
+
+                # Verifica se o tempo de execução excedeu o timeout
+                # (uma execução que terminou, com sucesso ou falha, é tratada abaixo pelo seu status)
+                if run.status in ['queued', 'in_progress', 'cancelling'] and time.time() - start_time > timeout:
+                    excedeu_tempo = True
+                    # Cancela a execução (na fila ou em andamento), para que a thread fique livre para a próxima pergunta
+                    if run.status in ['queued', 'in_progress']:
+                        await client_async.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+                    break # Sai do loop
 
-            # Capturar os tokens usados
-            # tokens_usados = run.get('usage', {}).get('total_tokens', 'Não disponível')  # Pega o total de tokens usados
-            tokens_usados = run.usage.completion_tokens # Obtém o número de tokens utilizados na resposta
-            resposta = messages.data[0].content[0].text.value # Extrai a resposta
-
-            # Retorna a resposta e o número de tokens utilizados no formato JSON
-            return jsonify({'answer': resposta, 'tokens_usados': tokens_usados})
-        # Se a execução ainda está em andamento
-        elif run.status == 'in_progress':
-            return jsonify({'answer': 'Erro na execução: O processamento demorou mais do que o esperado.'}) # Retorna a mensagem de erro no formato JSON
-        # Se houve algum erro na execução
-        else:
-            answer = f"Erro na execução: Erro: {run.status}" # Define a mensagem de erro
-            return jsonify({'answer': answer}) # Retorna a mensagem de erro no formato JSON
+            # Verifica se a execução foi completada com sucesso
+            if run.status == 'completed':
+                # Lista todas as mensagens na thread
+                messages = await client_async.beta.threads.messages.list(
+                    thread_id = thread_id # ID da thread associada
+                )
+
+                # Capturar os tokens usados
+                # tokens_usados = run.get('usage', {}).get('total_tokens', 'Não disponível')  # Pega o total de tokens usados
+                tokens_usados = run.usage.completion_tokens # Obtém o número de tokens utilizados na resposta
+                resposta = messages.data[0].content[0].text.value # Extrai a resposta
+
+                # Retorna a resposta e o número de tokens utilizados no formato JSON
+                return JSONResponse({'answer': resposta, 'tokens_usados': tokens_usados})
+            # Se a execução não terminou dentro do tempo máximo (ainda na fila ou em andamento)
+            elif excedeu_tempo:
+                return JSONResponse({'answer': 'Erro na execução: O processamento demorou mais do que o esperado.'}) # Retorna a mensagem de erro no formato JSON
+            # Se houve algum erro na execução
+            else:
+                answer = f"Erro na execução: Erro: {run.status}" # Define a mensagem de erro
+                return JSONResponse({'answer': answer}) # Retorna a mensagem de erro no formato JSON
     # Se nenhuma pergunta foi fornecida
     else:
-        return jsonify({"error": "Nenhuma pergunta fornecida"}), 400 # Retorna um erro 400
+        return JSONResponse({"error": "Nenhuma pergunta fornecida"}, status_code=400) # Retorna um erro 400
+
+def evento_sse(nome, dados):
+    # Formata um evento no padrão Server-Sent Events (uma linha 'event', uma linha 'data' em JSON e uma linha em branco)
+    return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+async def transmitir_resposta(question, session_id=None):
+    """
+    Envia a pergunta ao assistant e repassa a execução como eventos SSE, à medida que são produzidos.
+
+    Eventos enviados: 'status' (andamento da execução), 'texto' (trecho da resposta), 'fim' (tokens
+    utilizados na resposta) e 'erro' (mensagem de erro, no lugar de 'fim'). A transmissão sempre
+    termina com 'fim' ou 'erro', inclusive quando a OpenAI falha depois de a resposta ter começado.
+
+    Args:
+        question (str): Pergunta do usuário.
+        session_id (str): Identificador da sessão do Chat.
+
+    Yields:
+        str: Eventos no formato SSE.
+    """
+    try:
+        # Usa a thread da sessão do Chat (ver conversas.py); a thread fica reservada até a transmissão terminar
+        # O assistant ativo fica reservado até a transmissão terminar, mesmo que seja trocado no meio dela
+        async with usar_conversa(client_async, session_id) as thread_id, usar_assistente() as assistant_id:
+            # Adiciona mensagem à thread da sessão
+            await client_async.beta.threads.messages.create(thread_id=thread_id, role='user', content=question)
+
+            # Cria a execução em modo stream: os eventos chegam assim que são gerados, sem esperar a execução terminar
+            stream = await client_async.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                instructions='',
+                max_completion_tokens=MAX_TOKENS_OUTPUT,
+                stream=True
+            )
+            limite = time.monotonic() + TIMEOUT_RESPOSTA # Horário limite da execução
+            run_id = None # ID da execução, informado no primeiro evento
+            mensagens = 0 # Quantidade de mensagens do assistant já iniciadas (separadas por uma linha em branco)
+            async with stream:
+                eventos = stream.__aiter__()
+                while True:
+                    try:
+                        # Espera o próximo evento apenas até o horário limite, para que uma transmissão parada
+                        # (sem novos eventos) também seja interrompida
+                        event = await asyncio.wait_for(eventos.__anext__(), limite - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        # Cancela a execução, para que a thread fique livre para a próxima pergunta
+                        if run_id is not None:
+                            await client_async.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+                        yield evento_sse('erro', {'answer': 'Erro na execução: O processamento demorou mais do que o esperado.'})
+                        return
+
+                    if event.event == 'thread.run.created':
+                        run_id = event.data.id
+                    elif event.event in ['thread.run.queued', 'thread.run.in_progress']:
+                        yield evento_sse('status', {'status': event.data.status})
+                    elif event.event == 'thread.message.created':
+                        if mensagens:
+                            yield evento_sse('texto', {'texto': '\n\n'})
+                        mensagens += 1
+                    elif event.event == 'thread.message.delta':
+                        # Repassa apenas os trechos de texto (as chamadas do code interpreter não são exibidas)
+                        for bloco in event.data.delta.content or []:
+                            if bloco.type == 'text' and bloco.text and bloco.text.value:
+                                yield evento_sse('texto', {'texto': bloco.text.value})
+                    elif event.event == 'thread.run.completed':
+                        yield evento_sse('fim', {'tokens_usados': event.data.usage.completion_tokens})
+                        return
+                    elif event.event in EVENTOS_FALHA:
+                        yield evento_sse('erro', {'answer': f"Erro na execução: Erro: {event.data.status}"})
+                        return
+
+            # A transmissão terminou sem o evento de conclusão ou de falha da execução
+            yield evento_sse('erro', {'answer': 'Erro na execução: A resposta foi interrompida.'})
+    except openai.OpenAIError as erro:
+        # Os cabeçalhos (status 200) já foram enviados: a falha é informada como evento, sem interromper a transmissão
+        print(f"Erro na transmissão da resposta: {erro}")
+        yield evento_sse('erro', {'answer': f"Erro na execução: {erro}"})
+
+# Requisição para a API da OpenAI com a resposta transmitida aos poucos (Server-Sent Events)
+async def ask_openai_stream(request):
+    try:
+        data = await request.json() # Obtém os dados da requisição no formato JSON
+    except json.JSONDecodeError:
+        data = {} # Corpo ausente ou inválido é tratado como uma requisição sem pergunta
+    if not isinstance(data, dict): # O corpo precisa ser um objeto JSON (ex.: uma lista é rejeitada)
+        return JSONResponse({"error": "O corpo da requisição deve ser um objeto JSON"}, status_code=400)
+    question = data.get("question", "")
+    if not question:
+        return JSONResponse({"error": "Nenhuma pergunta fornecida"}, status_code=400) # Retorna um erro 400
+
+    return StreamingResponse(
+        transmitir_resposta(question, data.get("session_id")),
+        media_type='text/event-stream',
+        # Evita que proxies guardem ou acumulem os eventos antes de repassá-los
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Cria a aplicação ASGI, com as rotas /ask (resposta completa em JSON) e /ask/stream (resposta em SSE)
+# Em produção é servida pelo gunicorn com workers do uvicorn (ver deploy.yml)
+app = Starlette(routes=[
+    Route("/ask", ask_openai, methods=["POST"]),
+    Route("/ask/stream", ask_openai_stream, methods=["POST"]),
+], lifespan=lifespan)
 
 # Verifica se o script está sendo executado diretamente
 if __name__ == "__main__":
-    app.run(debug=True) # Inicia o servidor Flask em mode de debug
+    uvicorn.run(app, host="127.0.0.1", port=5000) # Inicia o servidor local na porta 5000
 
 
 
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import openai
+
+# Threads da OpenAI de cada sessão do Chat, usadas pelo back-end (back.py).
+# Cada sessão (identificada pelo 'session_id' enviado pela página de Chat) tem a sua própria thread, criada na
+# primeira pergunta. Perguntas de sessões diferentes rodam em paralelo; as da mesma sessão esperam a anterior
+# terminar, já que uma thread só aceita uma execução ativa por vez. As threads ficam em um LRU por processo:
+# as paradas há mais de TTL_CONVERSA segundos e as menos usadas além de MAX_CONVERSAS são descartadas.
+# Como o mapa de sessões fica na memória do processo, o back-end deve rodar com um único worker (-w 1 no deploy.yml).
+
+# Quantidade máxima de threads mantidas pelo processo
+MAX_CONVERSAS = int(os.getenv('CRM_MAX_CONVERSAS', '500'))
+# Tempo (em segundos) sem perguntas após o qual a thread de uma sessão é descartada
+TTL_CONVERSA = int(os.getenv('CRM_TTL_CONVERSA', str(60 * 60)))
+# Sessão usada pelas requisições que não informam 'session_id'
+SESSAO_PADRAO = 'padrao'
+
+# Sessões em ordem de uso (a menos usada primeiro): session_id -> {'thread_id', 'usado_em', 'em_uso', 'trava'}
+_conversas = OrderedDict()
+# Tarefas de remoção de threads em andamento (guardadas para não serem coletadas antes de terminar)
+_remocoes = set()
+
+
+def reservar_conversa(session_id):
+    """
+    Obtém (ou cria) o registro da sessão, marca-o como em uso e descarta as sessões expiradas ou excedentes.
+
+    Não há await nesta função, então ela roda inteira sem ser interrompida por outras requisições.
+
+    Args:
+        session_id (str): Identificador da sessão do Chat.
+
+    Returns:
+        tuple: (registro da sessão, lista de IDs das threads descartadas).
+    """
+    agora = time.time()
+    registro = _conversas.get(session_id)
+    if registro is None:
+        registro = {'thread_id': None, 'usado_em': agora, 'em_uso': 0, 'trava': asyncio.Lock()}
+        _conversas[session_id] = registro
+    registro['em_uso'] += 1
+    _conversas.move_to_end(session_id)
+
+    # Percorre do menos usado para o mais usado; sessões com perguntas em andamento nunca são descartadas
+    descartadas = []
+    excedentes = len(_conversas) - MAX_CONVERSAS
+    for sessao, conversa in list(_conversas.items()):
+        expirada = agora - conversa['usado_em'] > TTL_CONVERSA
+        if conversa['em_uso'] == 0 and (expirada or excedentes > 0):
+            del _conversas[sessao]
+            excedentes -= 1
+            if conversa['thread_id'] is not None:
+                descartadas.append(conversa['thread_id'])
+        elif excedentes <= 0 and not expirada:
+            break
+    return registro, descartadas
+
+
+async def apagar_threads(client, thread_ids):
+    # Apaga as threads descartadas na OpenAI (falhas são ignoradas: a thread apenas deixa de ser usada)
+    for thread_id in thread_ids:
+        try:
+            await client.beta.threads.delete(thread_id)
+        except openai.OpenAIError as erro:
+            print(f'Não foi possível apagar a thread {thread_id}: {erro}')
+
+
+@asynccontextmanager
+async def usar_conversa(client, session_id=None):
+    """
+    Fornece a thread da sessão durante uma pergunta, criando-a na primeira vez.
+
+    Args:
+        client (AsyncOpenAI): Client assíncrono da OpenAI.
+        session_id (str): Identificador da sessão do Chat. Se vazio, usa SESSAO_PADRAO.
+
+    Yields:
+        str: ID da thread da sessão.
+    """
+    registro, descartadas = reservar_conversa(session_id or SESSAO_PADRAO)
+    if descartadas:
+        tarefa = asyncio.create_task(apagar_threads(client, descartadas))
+        _remocoes.add(tarefa)
+        tarefa.add_done_callback(_remocoes.discard)
+    try:
+        # Espera as perguntas anteriores da mesma sessão terminarem
+        async with registro['trava']:
+            if registro['thread_id'] is None:
+                registro['thread_id'] = (await client.beta.threads.create()).id
+            yield registro['thread_id']
+    finally:
+        registro['em_uso'] -= 1
+        registro['usado_em'] = time.time()
@@ -0,0 +1,110 @@
+import pandas as pd
+from metricas import calcular_medidas, somar_medidas, reagregar_metricas
+from pontes import NOMES_TABELAS, construir_pontes
+
+# Cubo agregado da base do CRM, materializado pelo ETL e usado pelos dashboards.
+# Cada linha é uma combinação das dimensões abaixo com as medidas aditivas de metricas.py somadas, então os filtros
+# e agrupamentos das páginas percorrem o cubo (pequeno) em vez das linhas da base.
+
+# Dimensões do cubo (nomes usados pelos dashboards)
+DIMENSOES_CUBO = ['Ano', 'Vendedor', 'Fase atual', 'Origem', 'Setor', 'Perfil de cliente', 'Serviço']
+
+
+def construir_cubo(base):
+    """
+    Agrega a base em um cubo com as dimensões DIMENSOES_CUBO e as medidas aditivas de metricas.py.
+
+    Args:
+        base (DataFrame): Base com os nomes de colunas dos dashboards (ver preparar_para_dashboard).
+
+    Returns:
+        DataFrame: Cubo com uma linha por combinação existente das dimensões.
+    """
+    medidas = calcular_medidas(base)
+    medidas[DIMENSOES_CUBO] = base[DIMENSOES_CUBO]
+    return somar_medidas(medidas, DIMENSOES_CUBO)
+
+
+def fatiar_cubo(cubo, **filtros):
+    """
+    Filtra o cubo pelos valores informados para cada dimensão.
+
+    Args:
+        cubo (DataFrame): Cubo gerado por construir_cubo.
+        **filtros: Valor de cada dimensão a manter (ex.: Ano=2024, Vendedor='Fulano'). Valores None são ignorados.
+
+    Returns:
+        DataFrame: Linhas do cubo que atendem a todos os filtros.
+    """
+    mascara = pd.Series(True, index=cubo.index)
+    for dimensao, valor in filtros.items():
+        if valor is not None:
+            mascara &= cubo[dimensao] == valor
+    return cubo[mascara.to_numpy(dtype=bool, na_value=False)]
+
+
+def construir_cubo_explodido(base, ponte):
+    """
+    Agrega a base em um cubo com um único valor por linha no campo da tabela ponte (ex.: um vendedor por linha).
+
+    Cada card entra uma vez para cada valor do campo (um card com dois vendedores conta para os dois),
+    ligando a base à ponte pela posição do card.
+
+    Args:
+        base (DataFrame): Base com os nomes de colunas dos dashboards.
+        ponte (DataFrame): Tabela ponte do campo (ver pontes.construir_ponte).
+
+    Returns:
+        DataFrame: Cubo com as mesmas dimensões e medidas de construir_cubo.
+    """
+    campo = ponte.columns[1]
+    linhas = ponte['linha'].to_numpy()
+    medidas = calcular_medidas(base).iloc[linhas].reset_index(drop=True)
+    for dimensao in DIMENSOES_CUBO:
+        medidas[dimensao] = base[dimensao].iloc[linhas].reset_index(drop=True)
+    medidas[campo] = ponte[campo].reset_index(drop=True)
+    return somar_medidas(medidas, DIMENSOES_CUBO)
+
+
+def construir_tabelas_derivadas(base):
+    """
+    Constrói o cubo, as tabelas ponte e os cubos explodidos publicados junto com o snapshot.
+
+    Args:
+        base (DataFrame): Base com os nomes de colunas dos dashboards.
+
+    Returns:
+        dict: Tabelas por nome ('cubo', 'ponte_vendedores', 'cubo_vendedores', 'ponte_servicos', 'cubo_servicos').
+    """
+    tabelas = {'cubo': construir_cubo(base)}
+    for campo, ponte in construir_pontes(base).items():
+        tabelas[f'ponte_{NOMES_TABELAS[campo]}'] = ponte
+        tabelas[f'cubo_{NOMES_TABELAS[campo]}'] = construir_cubo_explodido(base, ponte)
+    return tabelas
+
+
+def agregar_cubo(cubo, dimensoes):
+    """
+    Soma as medidas do cubo por uma lista de dimensões e calcula as métricas derivadas.
+
+    Args:
+        cubo (DataFrame): Cubo (ou fatia do cubo).
+        dimensoes (list): Dimensões mantidas no resultado.
+
+    Returns:
+        DataFrame: Medidas somadas e métricas (ver metricas.finalizar_metricas).
+    """
+    return reagregar_metricas(cubo, dimensoes)
+
+
+def totalizar_cubo(cubo):
+    """
+    Soma todas as linhas do cubo.
+
+    Args:
+        cubo (DataFrame): Cubo (ou fatia do cubo).
+
+    Returns:
+        Series: Medidas somadas e métricas (ver metricas.finalizar_metricas).
+    """
+    return reagregar_metricas(cubo, []).iloc[0]
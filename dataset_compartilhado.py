@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import time
+
+import pyarrow as pa
+
+from snapshot import gravar_arrow, para_pandas
+from travas import trava_arquivo
+
+# Base do CRM compartilhada entre os processos da mesma máquina (réplicas do Streamlit e workers do gunicorn).
+# Um único processo lê a base da fonte e publica a tabela Arrow em memória compartilhada (/dev/shm);
+# os demais apenas mapeiam o arquivo em modo leitura. Números, datas, textos e inteiros apontam para o
+# arquivo mapeado (ver snapshot.para_arrow e snapshot.para_pandas); as categorias são convertidas por processo.
+
+# Diretório em memória compartilhada (ou, se não existir, no diretório temporário do sistema)
+DIRETORIO_COMPARTILHADO = os.getenv(
+    'CRM_SHM_DIR',
+    os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'crm_dataset'),
+)
+
+# Última versão mapeada por este processo, reaproveitada enquanto o ponteiro não mudar
+_anexado = {'versao': None, 'tabela': None}
+
+
+def _caminho(nome):
+    return os.path.join(DIRETORIO_COMPARTILHADO, nome)
+
+
+def ler_ponteiro():
+    """
+    Lê o ponteiro para a versão publicada atualmente.
+
+    Returns:
+        dict: {'versao', 'arquivo', 'publicado_em'}, ou None se nada foi publicado.
+    """
+    try:
+        with open(_caminho('atual.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def publicar_dataset(df, versao):
+    """
+    Publica o DataFrame como a versão atual da base compartilhada.
+
+    O arquivo Arrow é gravado por completo antes de o ponteiro ser trocado (os.replace é atômico),
+    então os leitores veem sempre a versão antiga ou a nova inteira. Arquivos antigos são apagados;
+    processos que ainda os têm mapeados continuam lendo normalmente até trocarem de versão.
+
+    Args:
+        df (DataFrame): Base pronta para uso nos dashboards.
+        versao (str): Versão dos dados.
+    """
+    os.makedirs(DIRETORIO_COMPARTILHADO, exist_ok=True)
+    arquivo = f'crm_{versao}.arrow'
+    gravar_arrow(df, _caminho(arquivo))
+
+    with open(_caminho('atual.json.tmp'), 'w') as f:
+        json.dump({'versao': versao, 'arquivo': arquivo, 'publicado_em': time.time()}, f)
+    os.replace(_caminho('atual.json.tmp'), _caminho('atual.json'))
+
+    for nome in os.listdir(DIRETORIO_COMPARTILHADO):
+        if nome.startswith('crm_') and nome.endswith('.arrow') and nome != arquivo:
+            os.remove(_caminho(nome))
+
+
+def anexar_dataset():
+    """
+    Mapeia em modo leitura a versão publicada atualmente.
+
+    A tabela mapeada é mantida pelo processo enquanto a versão não mudar; os DataFrames obtidos
+    dela compartilham os dados com o arquivo, exceto as categorias (ver snapshot.para_pandas).
+
+    Returns:
+        tuple: (DataFrame, ponteiro da versão), ou None se nada foi publicado.
+    """
+    ponteiro = ler_ponteiro()
+    if ponteiro is None:
+        return None
+    if _anexado['versao'] != ponteiro['versao']:
+        try:
+            with pa.memory_map(_caminho(ponteiro['arquivo']), 'r') as fonte:
+                tabela = pa.ipc.open_file(fonte).read_all()
+        except FileNotFoundError:
+            # A versão foi substituída entre a leitura do ponteiro e a abertura do arquivo
+            return None
+        _anexado['versao'], _anexado['tabela'] = ponteiro['versao'], tabela
+    return para_pandas(_anexado['tabela']), ponteiro
+
+
+def trava_carga():
+    # Garante que apenas um processo por vez carregue a base da fonte e a publique
+    # (no Windows, sem trava, cada processo carrega a base por conta própria)
+    return trava_arquivo(_caminho('carga.lock'))
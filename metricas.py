@@ -0,0 +1,123 @@
+import pandas as pd
+from schema import COLUNAS_TEMPO
+
+# Cálculo vetorizado das métricas de vendas (taxa de conversão, vendas ganhas, faturamento, tempo médio
+# de fechamento e tempo médio em cada fase) para qualquer lista de dimensões.
+# As métricas são obtidas em duas etapas: primeiro as medidas aditivas (somas e contagens) são somadas
+# em um único groupby; depois as médias e taxas são calculadas a partir das somas. Como as somas podem
+# ser somadas de novo, a mesma função serve tanto para a base quanto para o cubo agregado (cubo.py).
+
+# Fase de cada coluna de tempo (ex.: 'Qualificação' -> 'Tempo total na fase Qualificação (dias)')
+FASES_TEMPO = {coluna[len('Tempo total na fase '):-len(' (dias)')]: coluna for coluna in COLUNAS_TEMPO}
+
+# Medidas aditivas
+MEDIDAS = [
+    'oportunidades',    # Quantidade de cards
+    'ganhos',           # Quantidade de cards ganhos
+    'faturamento',      # Soma do 'Valor Final' dos cards ganhos
+    'dias_fechamento',  # Soma dos dias entre a criação e a entrada na fase 'Ganho'
+    'fechamentos',      # Quantidade de cards ganhos com as duas datas preenchidas
+]
+for fase in FASES_TEMPO:
+    MEDIDAS += [f'dias_{fase}', f'registros_{fase}']  # Soma dos dias na fase e quantidade de cards com o tempo preenchido
+
+
+def calcular_medidas(base, ganho=None):
+    """
+    Calcula as medidas aditivas de cada linha da base.
+
+    Args:
+        base (DataFrame): Base com os nomes de colunas dos dashboards.
+        ganho (Series): Máscara booleana dos cards ganhos. Por padrão, os cards na fase 'Ganho'.
+
+    Returns:
+        DataFrame: Uma coluna por medida em MEDIDAS, com o mesmo índice da base.
+    """
+    if ganho is None:
+        ganho = base['Fase atual'] == 'Ganho'
+    ganho = pd.Series(ganho, index=base.index).fillna(False).to_numpy(dtype=bool)
+    dias = (base['Primeira vez que entrou na fase Ganho'] - base['Criado em']).dt.days.where(ganho)
+
+    medidas = {
+        'oportunidades': 1,
+        'ganhos': ganho.astype('int64'),
+        'faturamento': base['Valor Final'].astype('float64').where(ganho, 0.0).fillna(0.0),
+        'dias_fechamento': dias.fillna(0).astype('int64'),
+        'fechamentos': dias.notna().astype('int64'),
+    }
+    for fase, coluna in FASES_TEMPO.items():
+        tempo = base[coluna].astype('float64')
+        medidas[f'dias_{fase}'] = tempo.fillna(0.0)
+        medidas[f'registros_{fase}'] = tempo.notna().astype('int64')
+    return pd.DataFrame(medidas, index=base.index)
+
+
+def somar_medidas(medidas, dimensoes):
+    """
+    Soma as medidas aditivas por uma lista de dimensões, em um único groupby.
+
+    Args:
+        medidas (DataFrame): Medidas aditivas (de calcular_medidas ou do cubo) e as colunas das dimensões.
+        dimensoes (list): Dimensões mantidas no resultado. Se vazia, soma todas as linhas.
+
+    Returns:
+        DataFrame: Uma linha por combinação existente das dimensões, com as medidas somadas.
+    """
+    if not dimensoes:
+        return medidas[MEDIDAS].sum().to_frame().T.reset_index(drop=True)
+    # observed=True mantém só as combinações que existem; dropna=False mantém os valores ausentes
+    return medidas.groupby(dimensoes, observed=True, dropna=False, sort=False)[MEDIDAS].sum().reset_index()
+
+
+def finalizar_metricas(somas):
+    """
+    Calcula as métricas que não são aditivas a partir das medidas somadas.
+
+    Args:
+        somas (DataFrame): Resultado de somar_medidas.
+
+    Returns:
+        DataFrame: As somas com 'taxa_conversao' (%), 'tempo_medio_fechamento' (dias) e
+        'tempo_medio_<fase>' (dias) para cada fase do funil.
+    """
+    def media(soma, quantidade):
+        quantidade = somas[quantidade].astype('float64')
+        return somas[soma] / quantidade.where(quantidade > 0)
+
+    somas['taxa_conversao'] = (media('ganhos', 'oportunidades') * 100).fillna(0.0)
+    somas['tempo_medio_fechamento'] = media('dias_fechamento', 'fechamentos')
+    for fase in FASES_TEMPO:
+        somas[f'tempo_medio_{fase}'] = media(f'dias_{fase}', f'registros_{fase}')
+    return somas
+
+
+def calcular_metricas(base, dimensoes, ganho=None):
+    """
+    Calcula as métricas de vendas da base por uma lista de dimensões.
+
+    Args:
+        base (DataFrame): Base com os nomes de colunas dos dashboards.
+        dimensoes (list): Dimensões do agrupamento (ex.: ['Vendedor'] ou ['Ano', 'Origem']). Se vazia, totaliza a base.
+        ganho (Series): Máscara booleana dos cards ganhos. Por padrão, os cards na fase 'Ganho'.
+
+    Returns:
+        DataFrame: Medidas somadas e métricas finais (ver finalizar_metricas).
+    """
+    medidas = calcular_medidas(base, ganho)
+    for dimensao in dimensoes:
+        medidas[dimensao] = base[dimensao]
+    return finalizar_metricas(somar_medidas(medidas, dimensoes))
+
+
+def reagregar_metricas(somas, dimensoes):
+    """
+    Soma de novo medidas já agregadas (ex.: uma fatia do cubo) por menos dimensões e recalcula as métricas.
+
+    Args:
+        somas (DataFrame): Medidas aditivas já somadas, com as colunas das dimensões.
+        dimensoes (list): Dimensões mantidas no resultado. Se vazia, totaliza.
+
+    Returns:
+        DataFrame: Medidas somadas e métricas finais (ver finalizar_metricas).
+    """
+    return finalizar_metricas(somar_medidas(somas, dimensoes))
@@ -1,11 +1,11 @@
 import streamlit as st
 import altair as alt
 from utils import (
-    carregar_base,
-    calcular_taxa_conversao,
+    carregar_cubo,
     preparar_dados_faturamento,
     preparar_dados_analise_vendas,
 )
+from cubo import fatiar_cubo, totalizar_cubo
 
 # Configurar a página para ter layout largo
 st.set_page_config(layout="wide")
@@ -38,34 +38,24 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# Carregar a base de dados
-base = carregar_base()
-
-# Filtrar somente vendas ganhas
-base_ganho = base[base['Fase atual'] == 'Ganho']
+# Carregar o cubo agregado (contagens e somas por ano, vendedor, fase e categorias)
+cubo = carregar_cubo()
 
 # Filtro de ano, e adição da opção 'Tudo' que engloba todos os anos
-anos_disponiveis = sorted(base_ganho['Ano'].dropna().unique(), reverse=True)
+anos_disponiveis = sorted(cubo.loc[cubo['ganhos'] > 0, 'Ano'].dropna().unique(), reverse=True)
 anos_disponiveis.append('Tudo')
 # Adição do selectbox, com os anos contidos na base e a opção 'Tudo'
 ano_selecionado = st.sidebar.selectbox("Selecione o ano:", anos_disponiveis)
 
-# Filtrar base de acordo com o ano selecionado no selectbox
-if ano_selecionado != 'Tudo':
-    base_filtrada = base_ganho[base_ganho['Ano'] == int(ano_selecionado)]
-else:
-    base_filtrada = base_ganho
-
-# Cálculo de Faturamento e Total de Vendas
-faturamento_total = base_filtrada['Valor Final'].sum()
-total_vendas_ganhas = len(base_filtrada)
+# Filtrar o cubo de acordo com o ano selecionado no selectbox
+ano = int(ano_selecionado) if ano_selecionado != 'Tudo' else None
+cubo_ano = fatiar_cubo(cubo, Ano=ano)
 
-# Cálculo da Taxa de Conversão
-if ano_selecionado != 'Tudo':
-    base_ano = base[base['Ano'] == int(ano_selecionado)]
-else:
-    base_ano = base
-taxa_conversao = calcular_taxa_conversao(base_ano)
+# Cálculo de Faturamento, Total de Vendas e Taxa de Conversão a partir do cubo
+totais = totalizar_cubo(cubo_ano)
+faturamento_total = totais['faturamento']
+total_vendas_ganhas = int(totais['ganhos'])
+taxa_conversao = totais['taxa_conversao']
 
 # Criar colunas para o título e as métricas
 col_title, col1, col2, col3 = st.columns([2, 1, 1, 1])
@@ -97,9 +87,6 @@ with col3:
 # Espaçamento entre as métricas e os gráficos
 st.markdown('<hr>', unsafe_allow_html=True)
 
-# Preparar dados para o gráfico de faturamento
-dados_faturamento = preparar_dados_faturamento(base_filtrada)
-
 # Colunas de texto
 col4, col5 = st.columns(2)
 
@@ -128,7 +115,18 @@ with col5:
 col6, col7 = st.columns(2)
 
 with col6:
-    st.subheader(f"Faturamento Acumulado ({ano_selecionado})")
+    # Criar uma linha com o subtítulo e o agrupamento por período alinhados horizontalmente
+    subcol1, subcol2 = st.columns([3, 1])
+
+    with subcol1:
+        st.subheader(f"Faturamento Acumulado ({ano_selecionado})")
+    with subcol2:
+        periodos = {'Dia': 'D', 'Semana': 'W', 'Mês': 'MS'}
+        periodo = st.selectbox("Período", list(periodos), key='periodo')
+
+    # Preparar dados para o gráfico de faturamento, somados por período (e com no máximo
+    # MAX_PONTOS_GRAFICO pontos, para que o gráfico continue leve com muitos anos de dados)
+    dados_faturamento = preparar_dados_faturamento(ano=ano, granularidade=periodos[periodo])
     # Resetar o índice para uso com Altair
     dados_faturamento = dados_faturamento.reset_index(drop=True)
     chart_faturamento = alt.Chart(dados_faturamento).mark_line(point=True).encode(
@@ -159,7 +157,7 @@ with col7:
     categoria = st.session_state['categoria']
 
     # Preparar dados para o gráfico de análise de vendas
-    dados_analise_vendas = preparar_dados_analise_vendas(base_filtrada, metrica, categoria)
+    dados_analise_vendas = preparar_dados_analise_vendas(metrica, categoria, ano)
 
     # Exibir o gráfico
     dados_analise_vendas = dados_analise_vendas.reset_index(drop=True)
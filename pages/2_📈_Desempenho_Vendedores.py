@@ -4,12 +4,15 @@ import plotly.express as px
 import plotly.graph_objects as go
 import altair as alt
 from utils import (
-    carregar_base,
-    calcular_taxa_conversao,
+    carregar_cubo,
+    filtrar_base,
+    buscar_leads,
+    dados_lead,
     preparar_dados_faturamento,
     preparar_dados_metricas_vendedores,
     definir_colunas_tempo
 )
+from cubo import agregar_cubo, fatiar_cubo, totalizar_cubo
 
 # Configurações globais da página, incluindo o título, ícone do CITi, layout largo e estado inicial da barra lateral
 st.set_page_config(layout="wide",
@@ -49,33 +52,23 @@ st.markdown("""
         }
     </style>
     """, unsafe_allow_html=True)
-# Carregar a base de dados
-base = carregar_base()
-
-# Filtrar somente vendas ganhas
-base_ganho = base[base['Fase atual'] == 'Ganho']
-
-
-# Verificar se algum valor em 'Vendedor' tem mais de um vendedor (separados por vírgula)
-base['Vendedor'] = base['Vendedor'].str.split(', ')
-base = base.explode('Vendedor')  # Separar os vendedores em linhas individuais
-
-# Manter apenas Nome e Sobrenome dos vendedores (separados por espaço)
-base['Vendedor'] = base['Vendedor'].apply(lambda x: ' '.join(x.split()[:2]))
-base_ganho['Vendedor'] = base_ganho['Vendedor'].apply(lambda x: ' '.join(x.split()[:2]))
+# Carregar os cubos agregados (usados nas métricas e gráficos); os leads são obtidos pelo índice da base
+cubo = carregar_cubo()
+# Cubo com um vendedor por linha (nome e sobrenome), montado pelo ETL a partir da tabela ponte de vendedores,
+# de modo que os cards com mais de um vendedor contam para cada um deles
+cubo_vendedores = carregar_cubo('Vendedor')
 
 # Sidebar para seleção do ano de acordo com as opções disponíveis 
-anos_disponiveis = sorted(base_ganho['Ano'].dropna().unique(), reverse=True)
+anos_disponiveis = sorted(cubo.loc[cubo['ganhos'] > 0, 'Ano'].dropna().unique(), reverse=True)
 ano_selecionado = st.sidebar.radio("Selecione o ano:", anos_disponiveis)
 
-# Filtrar a base geral pelo ano selecionado (só exibir informações daquele ano)
-base_filtrada = base[base['Ano'] == int(ano_selecionado)]
-# Filtrar base ganha pelo ano selecionado
-base_filtrada_ganho = base_ganho[base_ganho['Ano'] == int(ano_selecionado)]
+# Filtrar o cubo pelo ano selecionado (com e sem a separação dos vendedores)
+cubo_filtrado = fatiar_cubo(cubo, Ano=int(ano_selecionado))
+cubo_vendedores_ano = fatiar_cubo(cubo_vendedores, Ano=int(ano_selecionado))
 
 
 # Filtrar e ordenar os vendedores disponíveis
-vendedores_disponiveis = sorted(base_filtrada['Vendedor']. #filtra a base por vendedor e ordena alfabeticamente
+vendedores_disponiveis = sorted(cubo_vendedores_ano['Vendedor']. #filtra o cubo por vendedor e ordena alfabeticamente
                                 dropna(). # remove vendedores nulos
                                 unique()) # remove duplicatas de vendedores
 
@@ -87,19 +80,19 @@ vendedor_selecionado = st.sidebar.selectbox("Selecione o vendedor:", list(vended
 
 # Filtrar a base e modificar o título de acordo com o vendedor selecionado
 if vendedor_selecionado != 'Todos':
-    base_filtrada = base_filtrada[base_filtrada['Vendedor'] == vendedor_selecionado]
-    base_filtrada_ganho = base_filtrada_ganho[base_filtrada_ganho['Vendedor'] == vendedor_selecionado]
+    cubo_filtrado = fatiar_cubo(cubo_vendedores_ano, Vendedor=vendedor_selecionado)
+    # Cards do vendedor no ano, obtidos pelo índice da base (ordenada por ano, vendedor e fase)
+    base_filtrada = filtrar_base(ano=int(ano_selecionado), vendedor=vendedor_selecionado)
 
 # Faturamento total, número de vendas ganhas e taxa de conversão
-faturamento_total = base_filtrada_ganho['Valor Final'].sum()
-total_vendas_ganhas = len(base_filtrada_ganho)
-taxa_conversao = calcular_taxa_conversao(base_filtrada)
+totais = totalizar_cubo(cubo_filtrado)
+faturamento_total = totais['faturamento']
+total_vendas_ganhas = int(totais['ganhos'])
+taxa_conversao = totais['taxa_conversao']
 
 colunas_tempo = definir_colunas_tempo()
-# Criação de uma nova coluna com a quantidade de dias que o lead permaneceu no funil 
-base_filtrada_ganho['Quantidade de dias'] = (base_filtrada_ganho['Primeira vez que entrou na fase Ganho'] - base_filtrada_ganho['Criado em']).dt.days
-# Cálculo do tempo médio de fechamento a partir da coluna criada e da função 'mean'
-tempo_medio_fechamento = base_filtrada_ganho['Quantidade de dias'].mean()
+# Tempo médio de fechamento: média dos dias entre a criação do lead e a entrada na fase 'Ganho'
+tempo_medio_fechamento = totais['tempo_medio_fechamento']
 
 # Para quando o tempo médio de fechamento for zero
 tempo_medio_fechamento = tempo_medio_fechamento if tempo_medio_fechamento > 0 else 'Não consta'
@@ -145,7 +138,7 @@ def todos_escolhidos(faturamento_total, total_vendas_ganhas, taxa_conversao, tem
         metrica = st.session_state['metrica']
 
         # Preparar os dados
-        dados_metrica_vendedor = preparar_dados_metricas_vendedores(base_filtrada_ganho, metrica)
+        dados_metrica_vendedor = preparar_dados_metricas_vendedores(metrica, int(ano_selecionado))
 
         # Exibir o gráfico
         dados_metrica_vendedor = dados_metrica_vendedor.reset_index(drop=True)
@@ -175,9 +168,8 @@ def todos_escolhidos(faturamento_total, total_vendas_ganhas, taxa_conversao, tem
 
     with col5:
         # Gráfico da taxa de conversão por vendedor
-        # Agrupa os dados da base filtrada por vendedor e aplica a função de cálculo de taxa de conversão a cada grupo.
-        # Em seguida, reinicia o índice para transformar o índice 'Vendedor' em uma coluna.
-        taxa_conversao_vendedores = base_filtrada.groupby('Vendedor').apply(calcular_taxa_conversao).reset_index()
+        # Agrupa o cubo do ano por vendedor, somando oportunidades e vendas ganhas para obter a taxa de conversão de cada um.
+        taxa_conversao_vendedores = agregar_cubo(cubo_vendedores_ano, ['Vendedor'])[['Vendedor', 'taxa_conversao']]
         # Renomear as colunas do df resultante para 'Vendedor' e 'Taxa de Conversão', facilitando a leitura dos dados.
         taxa_conversao_vendedores.columns = ['Vendedor', 'Taxa de Conversão']
         
@@ -202,10 +194,11 @@ def todos_escolhidos(faturamento_total, total_vendas_ganhas, taxa_conversao, tem
 
 
         # Gráfico de pizza com a quantidade de negociações em cada fase
-        # Filtrar as fases com mais de 0 negociações e exibir o gráfico
-        if not base_filtrada.empty:
+        # Somar as negociações de cada fase no cubo e exibir o gráfico
+        negociacoes_fase = agregar_cubo(cubo_vendedores_ano, ['Fase atual'])
+        if not negociacoes_fase.empty:
             # Criar o gráfico
-            fig = px.pie(base_filtrada, names='Fase atual', title='Panorama de negociações por Fase', 
+            fig = px.pie(negociacoes_fase, names='Fase atual', values='oportunidades', title='Panorama de negociações por Fase', 
                         color='Fase atual', color_discrete_sequence=px.colors.sequential.Blugrn_r, width=400, height=320)
             fig.update_layout(title_x=0.12,
                              legend=dict(
@@ -253,8 +246,8 @@ def vendedor_selecionados(faturamento_total, total_vendas_ganhas, taxa_conversao
     st.markdown('<hr>', unsafe_allow_html=True)
 
     col4, col5 = st.columns([1.25,1])
-    # Filtrar a base de dados do vendedor selecionado
-    base_vendedor = base_filtrada[base_filtrada['Vendedor'] == vendedor_selecionado]
+    # Base de dados do vendedor selecionado (já filtrada pelo índice)
+    base_vendedor = base_filtrada
     
     # Converter 'Criado em' para datetime, se ainda não estiver
     if not pd.api.types.is_datetime64_any_dtype(base_vendedor['Criado em']):
@@ -270,20 +263,18 @@ def vendedor_selecionados(faturamento_total, total_vendas_ganhas, taxa_conversao
             situacao = st.selectbox("Situação", ['Ativo', 'Geral'], key='situacao')
         
         # Filtrar com base na situação selecionada
-        base_filtrada_situacao = base_vendedor.copy()
         # Caso a siuação seja 'Ativo', excluir registros onde a 'Fase atual' é 'Ganho', 'Perdido' ou 'Leads não-qualificados'
         if situacao == 'Ativo':
             base_filtrada_situacao = base_vendedor[~base_vendedor['Fase atual'].isin(['Ganho', 'Perdido', 'Leads não-qualificados'])]
         else:
             base_filtrada_situacao = base_vendedor  # Caso 'Geral', mantém todos os leads
 
-        # Empresas filtradas com base na situação escolhida (em subcol2)
-        # Filtra a lista 'empresas_filtradas', removendo entradas que estão vazias (dropna) ou contêm apenas espaços em branco (!= '').
-        # Usa o método 'str.strip()' para remover espaços em branco antes de verificar se a entrada é uma string vazia.
-        empresas_filtradas = base_filtrada_situacao['Empresa'].dropna()
-        empresas_filtradas = empresas_filtradas[empresas_filtradas.str.strip() != '']
-        
         with subcol2:
+            # Campo de busca: o índice de leads procura pelo começo do nome (sem diferenciar acentos e
+            # maiúsculas) e, se nenhum lead começar com o texto, pelos nomes mais parecidos
+            busca = st.text_input("Buscar lead", key='busca_lead')
+            # Leads da situação escolhida, obtidos pelo índice a partir das posições dos cards
+            empresas_filtradas = buscar_leads(busca, base_filtrada_situacao.index)
             # Selecionar o lead caso exista uma empresa disponível para a situação selecionada
             if len(empresas_filtradas) > 0:
                 lead_selecionado = st.selectbox("Selecione o Lead", empresas_filtradas, key='lead')
@@ -293,8 +284,8 @@ def vendedor_selecionados(faturamento_total, total_vendas_ganhas, taxa_conversao
                 lead_selecionado = None  # Definir como None para evitar erros posteriores
         
         if lead_selecionado:
-            # Selecionar dados do lead selecionado, com base na coluna 'Empresa'
-            lead_data = base_filtrada_situacao[base_filtrada_situacao['Empresa'] == lead_selecionado]
+            # Selecionar dados do lead selecionado pelas posições dos seus cards no índice de leads
+            lead_data = dados_lead(lead_selecionado, base_filtrada_situacao.index)
             # Se o conteúdo de 'lead_data' não estiver vazio
             if not lead_data.empty:
                 # Calcular o tempo total no funil somando as colunas de dias
@@ -350,9 +341,8 @@ def vendedor_selecionados(faturamento_total, total_vendas_ganhas, taxa_conversao
                 st.warning("Dados do lead não encontrados.")
 
     with col5:
-        # Agrupar a base de dados filtrada por vendedor e aplicar a função 'calcular_taxa_conversao' a cada grupo para calcular a taxa de conversão.
-        # Em seguida, reiniciar o índice para transformar 'Vendedor' em uma coluna regular.
-        taxa_conversao_vendedor = base_filtrada.groupby('Vendedor').apply(calcular_taxa_conversao).reset_index()
+        # Agrupar o cubo filtrado por vendedor, somando oportunidades e vendas ganhas para calcular a taxa de conversão.
+        taxa_conversao_vendedor = agregar_cubo(cubo_filtrado, ['Vendedor'])[['Vendedor', 'taxa_conversao']]
         # Renomear as colunas do df resultante para 'Vendedor' e 'Taxa de Conversão', facilitando a interpretação dos dados.
         taxa_conversao_vendedor.columns = ['Vendedor', 'Taxa de Conversão']
         
@@ -405,13 +395,12 @@ def vendedor_selecionados(faturamento_total, total_vendas_ganhas, taxa_conversao
         with subcol1:
             # Selectbox para escolha da categoria
             categoria = st.selectbox("Selecione a Categoria", ['Origem', 'Setor', 'Serviço', 'Perfil de cliente'], key='categoria')
-            # Filtrar a base de dados para manter apenas os registros em que a coluna especificada por 'categoria' contém valores do tipo string e que não são compostos apenas por dígitos.
-            # Usar 'apply' com uma função lambda que verifica se o valor é uma string e não é numérico.
-            base_filtrada_categoria = base_filtrada[base_filtrada[categoria].apply(lambda x: isinstance(x, str) and not x.isdigit())]
-        
-            # Contando quantas vezes cada valor da categoria aparece
-            categoria_count = base_filtrada_categoria[categoria].value_counts().reset_index()
+            # Somando no cubo quantos leads existem em cada valor da categoria
+            categoria_count = agregar_cubo(cubo_filtrado, [categoria])[[categoria, 'oportunidades']]
             categoria_count.columns = [categoria, 'Quantidade']
+            # Manter apenas os valores que não são compostos só por dígitos
+            # (categorias sem nenhum lead são descartadas)
+            categoria_count = categoria_count[~categoria_count[categoria].astype(str).str.isdigit() & (categoria_count['Quantidade'] > 0)]
 
             # Atualiza o placeholder 'title_placeholder' (que foi criado anteriormente, mas estava vazio) para exibir um título de acordo com a categoria selecionada 
             title_placeholder.markdown(f"#### Análise dos leads por {categoria}")
@@ -1,10 +1,12 @@
 import streamlit as st
 import requests
+import json
+import uuid
 import pandas as pd
 import tiktoken  # Biblioteca para calcular tokens
 import shelve
 from dotenv import load_dotenv
-from utils import carregar_base
+from utils import exibir_tabela_paginada
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -17,13 +19,14 @@ def contar_tokens(texto):
 # Definir limites de tokens
 MAX_TOKENS_INPUT = 100  # Exemplo: limite de 100 tokens de entrada
 
-# Carregar a base de dados diretamente do sheets
-df = carregar_base()
-
 # Inicializar o estado da sessão para armazenar o histórico
 if 'historico' not in st.session_state:
     st.session_state.historico = []
 
+# Identificador da sessão enviado ao back-end, que mantém uma thread de conversa para cada sessão
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 # Funções para salvar e carregar histórico de chat usando shelve
 def load_chat_history():
     with shelve.open("chat_history") as db:
@@ -48,17 +51,53 @@ st.sidebar.header("Histórico do Chat Atual")
 if st.sidebar.button("Limpar Histórico"):
     st.session_state.messages.clear()  # Limpa o histórico de mensagens
     st.session_state.historico.clear()  # Limpa o histórico de perguntas e respostas
+    st.session_state.session_id = str(uuid.uuid4())  # Inicia uma nova conversa (nova thread no back-end)
     save_chat_history(st.session_state.messages)  # Atualiza o histórico salvo
     st.sidebar.success("Histórico limpo com sucesso!")  # Mensagem de sucesso
 
 USER_AVATAR = "🐷"
 BOT_AVATAR = "🤖"
 
-# Tabela dentro de um botão expansível
+# Tabela dentro de um botão expansível (paginada: só a página visível é enviada ao navegador)
 with st.expander("Visualizar Tabela Completa", expanded=False):
-    st.dataframe(df)
+    exibir_tabela_paginada()
 
 route = st.secrets["ROUTE"]
+# Rota que transmite a resposta aos poucos (Server-Sent Events)
+route_stream = st.secrets.get("ROUTE_STREAM", route.rstrip("/") + "/stream")
+
+# Função para ler os eventos SSE enviados pelo back-end, na ordem em que chegam
+def ler_eventos(response):
+    response.encoding = "utf-8"
+    evento, dados = None, []
+    for linha in response.iter_lines(decode_unicode=True):
+        if linha.startswith("event:"):
+            evento = linha[len("event:"):].strip()
+        elif linha.startswith("data:"):
+            dados.append(linha[len("data:"):].strip())
+        elif not linha and evento:  # Linha em branco: fim do evento
+            yield evento, json.loads("\n".join(dados))
+            evento, dados = None, []
+
+# Função que devolve os trechos da resposta para o st.write_stream e guarda os tokens usados
+def trechos_resposta(response, resultado):
+    for evento, dados in ler_eventos(response):
+        if evento == "texto":
+            yield dados["texto"]
+        elif evento == "fim":
+            resultado["tokens_usados"] = dados["tokens_usados"]
+            return
+        elif evento == "erro":
+            yield dados["answer"]
+            return
+    # A conexão terminou antes do evento final ('fim' ou 'erro')
+    yield "\n\nErro: a resposta foi interrompida."
+
+# Exibir mensagens anteriores (em ordem cronológica)
+for message in st.session_state.messages:
+    avatar = USER_AVATAR if message["role"] == "user" else BOT_AVATAR
+    with st.chat_message(message["role"], avatar=avatar):
+        st.markdown(message["content"])
 
 # Interface de chat
 if prompt := st.chat_input("Mensagem CITiAssistant:"):
@@ -67,28 +106,30 @@ if prompt := st.chat_input("Mensagem CITiAssistant:"):
     if tokens_usados_pergunta > MAX_TOKENS_INPUT:
         st.warning(f"A pergunta excede o limite máximo de {MAX_TOKENS_INPUT} tokens.")
     else:
-        # Fazer a requisição para a API
-        response = requests.post(route, json={"question": prompt})
-        if response.status_code == 200:
-            data = response.json()
-            resposta = data.get('answer')
-            tokens_usados_resposta = data.get('tokens_usados', 'Não disponível')  # Pega o número de tokens usados na resposta
-
-            # Adicionar a pergunta e resposta no histórico
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            st.session_state.messages.append({"role": "assistant", "content": resposta})
-
-            # Adicionar ao histórico
-            st.session_state.historico.append({"pergunta": prompt, "resposta": resposta, "tokens_pergunta": tokens_usados_pergunta, "tokens_resposta": tokens_usados_resposta})
-        else:
-            st.write(f"Erro: {response.status_code}")
-            st.write(response.text)
-
-# Exibir mensagens anteriores (em ordem cronológica)
-for message in st.session_state.messages:
-    avatar = USER_AVATAR if message["role"] == "user" else BOT_AVATAR
-    with st.chat_message(message["role"], avatar=avatar):
-        st.markdown(message["content"])
+        # Fazer a requisição para a API, recebendo a resposta aos poucos
+        try:
+            with requests.post(route_stream, json={"question": prompt, "session_id": st.session_state.session_id}, stream=True) as response:
+                if response.status_code == 200:
+                    with st.chat_message("user", avatar=USER_AVATAR):
+                        st.markdown(prompt)
+                    # Exibe cada trecho assim que ele chega; ao final, st.write_stream devolve a resposta completa
+                    resultado = {"tokens_usados": "Não disponível"}
+                    with st.chat_message("assistant", avatar=BOT_AVATAR):
+                        resposta = st.write_stream(trechos_resposta(response, resultado))
+                    tokens_usados_resposta = resultado["tokens_usados"]  # Número de tokens usados na resposta
+
+                    # Adicionar a pergunta e resposta no histórico
+                    st.session_state.messages.append({"role": "user", "content": prompt})
+                    st.session_state.messages.append({"role": "assistant", "content": resposta})
+
+                    # Adicionar ao histórico
+                    st.session_state.historico.append({"pergunta": prompt, "resposta": resposta, "tokens_pergunta": tokens_usados_pergunta, "tokens_resposta": tokens_usados_resposta})
+                else:
+                    st.write(f"Erro: {response.status_code}")
+                    st.write(response.text)
+        # Falhas de conexão com o back-end (inclusive no meio da transmissão) são exibidas sem interromper a página
+        except requests.RequestException as erro:
+            st.error(f"Não foi possível obter a resposta do servidor: {erro}")
 
 # Sidebar com histórico de perguntas e respostas em formato expansível
 with st.sidebar.expander("Histórico de Perguntas e Respostas", expanded=True):  # Expandido por padrão
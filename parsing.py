@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Conversão vetorizada de números e datas exportados pelo Pipefy e pelo Google Sheets,
+# nos formatos brasileiro (1.234,56 e 31/12/2024) e americano (1,234.56 e 12/31/2024)
+
+# Números com separador de milhar opcional: pt-BR usa '.' no milhar e ',' no decimal; en-US o contrário
+# (ambos aceitam notação científica, ex.: "1,5E-05" e "1.5e-05")
+PADRAO_PTBR = r'^[+-]?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?(?:[eE][+-]?\d+)?$'
+PADRAO_ENUS = r'^[+-]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?:[eE][+-]?\d+)?$'
+
+# Formatos de data testados (a ordem é ajustada conforme os valores de cada coluna)
+FORMATOS_ISO = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d']
+FORMATOS_DIA_PRIMEIRO = ['%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y']
+FORMATOS_MES_PRIMEIRO = ['%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y']
+
+# Quantidade de valores usados para escolher a ordem em que os formatos de data são testados
+TAMANHO_AMOSTRA = 200
+
+# Último formato que funcionou para cada coluna e ordem de dia/mês ((chave, dayfirst) -> formato), para que a
+# próxima conversão comece por ele. A ordem faz parte da chave: a mesma coluna pode vir de fontes com ordens diferentes
+_formatos_por_coluna = {}
+
+
+def _texto_preenchido(serie):
+    # Retorna a série como texto (sem espaços nas pontas) e a máscara dos valores não vazios
+    texto = serie.astype(object).where(serie.notna(), '').astype(str).astype('string[pyarrow]').str.strip()
+    return texto, texto != ''
+
+
+def converter_numeros(serie, padrao='pt-BR'):
+    """
+    Converte uma coluna para número, aceitando textos em pt-BR ("13,676065", "1.234,5")
+    e en-US ("13.676065", "1,234.5").
+
+    Cada valor é convertido pelo formato que ele segue; valores ambíguos (ex.: "1.234")
+    usam o formato predominante na coluna, ou o padrão informado em caso de empate.
+
+    Args:
+        serie (Series): Coluna a ser convertida.
+        padrao (str): Formato usado para desempatar ('pt-BR' ou 'en-US').
+
+    Returns:
+        tuple: (Series com float64, número de valores preenchidos que não puderam ser convertidos).
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie, 0
+
+    texto, preenchido = _texto_preenchido(serie)
+    texto = texto.str.replace(r'^R\$\s*', '', regex=True)
+    ptbr = texto.str.match(PADRAO_PTBR)
+    enus = texto.str.match(PADRAO_ENUS)
+
+    # Formato predominante na coluna, considerando só os valores que seguem um único formato
+    so_ptbr = int((ptbr & ~enus).sum())
+    so_enus = int((enus & ~ptbr).sum())
+    usar_ptbr = so_ptbr > so_enus or (so_ptbr == so_enus and padrao == 'pt-BR')
+    como_ptbr = ptbr & (~enus | usar_ptbr)
+
+    # Só os valores que seguem algum dos formatos são convertidos (os demais viram NaN);
+    # a conversão de texto para float é feita pelo pyarrow
+    normalizado = texto.str.replace(',', '', regex=False)
+    normalizado = normalizado.mask(como_ptbr, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    numeros = normalizado.where(ptbr | enus).astype('float64[pyarrow]').astype('float64')
+
+    falhas = int((preenchido & numeros.isna()).sum())
+    return numeros, falhas
+
+
+def converter_datas(serie, dayfirst=False, chave=None):
+    """
+    Converte uma coluna para datetime testando formatos explícitos (ano-mês-dia, dia/mês/ano e
+    mês/dia/ano) com o strptime do pyarrow, sem inferência valor a valor.
+
+    Os formatos são testados na ordem de acerto em uma amostra da coluna, e cada um é aplicado de
+    forma vetorizada apenas aos valores que ainda não foram convertidos. Se a amostra for ambígua
+    (dia/mês e mês/dia acertam igual), vale a ordem indicada por 'dayfirst'. O melhor formato fica
+    guardado por 'chave' e 'dayfirst' e é testado primeiro na próxima vez com os mesmos argumentos.
+
+    Args:
+        serie (Series): Coluna a ser convertida.
+        dayfirst (bool): Se datas com barra estão, em geral, no formato dia/mês/ano.
+        chave (str): Identificador da coluna para guardar o formato (ex.: nome da coluna).
+
+    Returns:
+        tuple: (Series com datetime64, número de valores preenchidos que não puderam ser convertidos).
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, 0
+
+    texto, preenchido = _texto_preenchido(serie)
+    valores = pa.array(texto.array)
+    restante = preenchido.to_numpy(dtype=bool, na_value=False)
+
+    com_barra = FORMATOS_DIA_PRIMEIRO + FORMATOS_MES_PRIMEIRO if dayfirst else FORMATOS_MES_PRIMEIRO + FORMATOS_DIA_PRIMEIRO
+    ordem_conhecida = FORMATOS_ISO + com_barra
+    ordem_oposta = FORMATOS_MES_PRIMEIRO if dayfirst else FORMATOS_DIA_PRIMEIRO
+    formatos = list(ordem_conhecida)
+    guardado = _formatos_por_coluna.get((chave, dayfirst))
+    if guardado is not None:
+        formatos.remove(guardado)
+        formatos.insert(0, guardado)
+
+    def converter(textos, formato):
+        return pc.strptime(textos, format=formato, unit='ns', error_is_null=True).to_numpy(zero_copy_only=False)
+
+    # Ordena os formatos pelo acerto em uma amostra, a menos que o formato guardado já converta a amostra toda.
+    # Em caso de empate (ex.: amostra só com dias até 12, em que dia/mês e mês/dia acertam igual), vale a ordem
+    # indicada por 'dayfirst'; por isso um formato guardado na ordem oposta sempre passa pela amostra
+    amostra = valores.take(np.flatnonzero(restante)[:TAMANHO_AMOSTRA])
+    def acertos(formato):
+        return int((~np.isnat(converter(amostra, formato))).sum())
+    if len(amostra) > 0 and (formatos[0] in ordem_oposta or acertos(formatos[0]) < len(amostra)):
+        formatos.sort(key=lambda formato: (-acertos(formato), ordem_conhecida.index(formato)))
+
+    datas = np.full(len(valores), np.datetime64('NaT'), dtype='datetime64[ns]')
+    for formato in formatos:
+        posicoes = np.flatnonzero(restante)
+        if len(posicoes) == 0:
+            break
+        convertidas = converter(valores.take(posicoes), formato)
+        ok = ~np.isnat(convertidas)
+        datas[posicoes[ok]] = convertidas[ok]
+        restante[posicoes[ok]] = False
+
+    # O que sobrar (ex.: frações de segundo ou fuso horário) passa pelo parser ISO 8601 do pandas
+    posicoes = np.flatnonzero(restante)
+    if len(posicoes) > 0:
+        convertidas = pd.to_datetime(valores.take(posicoes).to_numpy(zero_copy_only=False), format='ISO8601', errors='coerce', utc=True)
+        convertidas = convertidas.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+        ok = ~np.isnat(convertidas)
+        datas[posicoes[ok]] = convertidas[ok]
+        restante[posicoes[ok]] = False
+
+    if chave is not None and len(amostra) > 0:
+        _formatos_por_coluna[(chave, dayfirst)] = formatos[0]
+
+    datas = pd.Series(datas, index=serie.index, name=serie.name)
+    falhas = int(restante.sum())
+    return datas, falhas
@@ -0,0 +1,98 @@
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Tabelas ponte para os campos com mais de um valor por card ('Vendedor' e 'Serviço', separados por vírgula).
+# Cada ponte tem uma linha por par (card, valor): 'linha' é a posição do card na base e a coluna do campo
+# é categórica, ou seja, guarda um código inteiro por valor. Os textos são separados uma única vez,
+# pelo ETL (ou na carga da base), e as páginas filtram e agregam pelos códigos.
+
+# Palavras ignoradas ao escolher o sobrenome do nome curto do vendedor
+PARTICULAS = {'de', 'da', 'do', 'das', 'dos', 'e'}
+
+# Campos com mais de um valor por card e se os valores são nomes de pessoas (reduzidos a nome e sobrenome)
+CAMPOS_MULTIVALORADOS = {'Vendedor': True, 'Serviço': False}
+# Nome usado nos arquivos das tabelas de cada campo (ex.: 'ponte_vendedores')
+NOMES_TABELAS = {'Vendedor': 'vendedores', 'Serviço': 'servicos'}
+
+
+def nome_curto(nome):
+    """
+    Reduz um nome ao primeiro nome e ao primeiro sobrenome, ignorando partículas (de, da, dos...).
+
+    Args:
+        nome (str): Nome completo (ex.: "Maria de Souza Lima").
+
+    Returns:
+        str: Nome curto (ex.: "Maria Souza").
+    """
+    palavras = nome.split()
+    if not palavras:
+        return ''
+    sobrenomes = [palavra for palavra in palavras[1:] if palavra.lower() not in PARTICULAS]
+    return ' '.join(palavras[:1] + sobrenomes[:1])
+
+
+def chave_nome(nome):
+    # Chave usada para reconhecer grafias diferentes do mesmo nome (sem acentos e em minúsculas)
+    sem_acentos = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+    return sem_acentos.lower()
+
+
+def construir_ponte(serie, nomes=False):
+    """
+    Separa um campo com valores separados por vírgula em uma tabela ponte (card -> valor).
+
+    O texto de cada rótulo distinto é separado uma única vez e as linhas são ligadas aos valores
+    pelo código do rótulo. Com nomes=True, os valores são reduzidos ao nome curto, e grafias que
+    diferem só em acentos ou maiúsculas são unificadas na grafia mais frequente.
+
+    Args:
+        serie (Series): Campo da base (ex.: base['Vendedor']).
+        nomes (bool): Se os valores são nomes de pessoas.
+
+    Returns:
+        DataFrame: Colunas 'linha' (posição do card na base) e o campo (categórico), ordenadas por linha.
+    """
+    categorias = serie.astype('category')
+    codigos = categorias.cat.codes.to_numpy()
+    rotulos = categorias.cat.categories
+
+    # Valores de cada rótulo distinto
+    pares = pd.DataFrame(
+        [(codigo, valor.strip()) for codigo, rotulo in enumerate(rotulos) for valor in str(rotulo).split(',')],
+        columns=['rotulo', 'valor'],
+    )
+    if nomes:
+        pares['valor'] = pares['valor'].map(nome_curto)
+        # Grafia escolhida para cada chave: a que aparece em mais cards
+        cards_por_rotulo = np.bincount(codigos[codigos >= 0], minlength=len(rotulos))
+        pares['cards'] = cards_por_rotulo[pares['rotulo']]
+        pares['chave'] = pares['valor'].map(chave_nome)
+        grafias = pares.groupby(['chave', 'valor'])['cards'].sum().reset_index()
+        grafias = grafias.sort_values('cards', ascending=False).drop_duplicates('chave')
+        pares['valor'] = pares['chave'].map(grafias.set_index('chave')['valor'])
+    pares = pares.drop_duplicates(['rotulo', 'valor'])
+
+    # Liga cada card aos valores do seu rótulo pelo código inteiro do rótulo
+    linhas = pd.DataFrame({'linha': np.arange(len(codigos), dtype='int32'), 'rotulo': codigos})
+    ponte = linhas.merge(pares[['rotulo', 'valor']], on='rotulo').sort_values('linha', kind='stable')
+    return pd.DataFrame({
+        'linha': ponte['linha'].to_numpy(),
+        serie.name: pd.Categorical(ponte['valor'].to_numpy()),
+    })
+
+
+def construir_pontes(base):
+    """
+    Constrói as tabelas ponte de todos os campos em CAMPOS_MULTIVALORADOS.
+
+    Args:
+        base (DataFrame): Base com os nomes de colunas dos dashboards.
+
+    Returns:
+        dict: Tabela ponte de cada campo (ex.: {'Vendedor': ..., 'Serviço': ...}).
+    """
+    return {campo: construir_ponte(base[campo], nomes) for campo, nomes in CAMPOS_MULTIVALORADOS.items()}
+
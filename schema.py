@@ -0,0 +1,123 @@
+import pandas as pd
+import pyarrow as pa
+from parsing import converter_numeros, converter_datas
+
+# Definição única das colunas da base do CRM (nomes, ordem e tipos), usada pelo ETL e pelos dashboards
+
+# Tipos usados na base
+CATEGORIA = 'category'         # Valores repetidos (fases, vendedores, setores, origens, perfis, serviços)
+TEXTO = 'string[pyarrow]'      # Texto livre (nomes, empresas, motivos)
+NUMERO = 'Float64'             # Valores e tempos (float que aceita valores ausentes)
+DATA = 'datetime64[ns]'
+INTEIRO = 'Int64'              # Identificador do card
+
+# Tipos usados pelos dashboards, os mesmos em que o snapshot e a base em memória compartilhada são lidos
+# sem copiar os dados (ver snapshot.para_pandas): números com NaN e datas com NaT, e inteiros no Arrow
+TIPOS_DASHBOARD = {
+    NUMERO: 'float64',
+    DATA: 'datetime64[ns]',
+    INTEIRO: pd.ArrowDtype(pa.int64()),
+}
+ANO = pd.ArrowDtype(pa.int16())
+
+# Colunas de tempo em cada fase do funil (em dias)
+COLUNAS_TEMPO = [
+    'Tempo total na fase Base de prospects (dias)',
+    'Tempo total na fase Qualificação (dias)',
+    'Tempo total na fase Diagnóstico (dias)',
+    'Tempo total na fase Montagem de proposta (dias)',
+    'Tempo total na fase Apresentação de proposta (dias)',
+    'Tempo total na fase Negociação (dias)',
+    'Tempo total na fase Renegociação (dias)'
+]
+
+# Colunas da base na ordem em que são gravadas no Google Sheets, com o tipo de cada uma
+COLUNAS = {
+    'Fase atual': CATEGORIA,
+    'Criado em': DATA,
+    'Nome do cliente': TEXTO,
+    'Empresa': TEXTO,
+    'Responsável': CATEGORIA,
+    'Perfil de cliente': CATEGORIA,
+    'Setor': CATEGORIA,
+    'Checklist vertical': CATEGORIA,
+    'Origem': CATEGORIA,
+    'Valor Final': NUMERO,
+    'Motivo da perda': TEXTO,
+    'Motivo da não qualificação': TEXTO,
+    'Tempo total na fase Base de prospects (dias)': NUMERO,
+    'Tempo total na fase Qualificação (dias)': NUMERO,
+    'Tempo total na fase Diagnóstico (dias)': NUMERO,
+    'Tempo total na fase Montagem de proposta (dias)': NUMERO,
+    'Tempo total na fase Apresentação de proposta (dias)': NUMERO,
+    'Tempo total na fase Negociação (dias)': NUMERO,
+    'Primeira vez que entrou na fase Ganho': DATA,
+    'Tempo total na fase Renegociação (dias)': NUMERO,
+    # Colunas usadas para identificar o card e o momento da última atualização (modo incremental)
+    'Código': INTEIRO,
+    'Atualizado em': DATA,
+}
+
+COLUNAS_CONTROLE = ['Código', 'Atualizado em']
+COLUNAS_ORDENADAS = [coluna for coluna in COLUNAS if coluna not in COLUNAS_CONTROLE]
+
+# Nomes usados pelos dashboards para algumas colunas da base
+RENOMEAR_DASHBOARD = {
+    'Responsável': 'Vendedor',
+    'Checklist vertical': 'Serviço',
+}
+
+
+def aplicar_schema(df, dayfirst=False):
+    """
+    Converte as colunas conhecidas da base para os tipos definidos em COLUNAS.
+
+    Textos e categorias ausentes viram strings vazias, como na planilha lida pelos dashboards.
+    Colunas que já estão no tipo usado pelos dashboards (TIPOS_DASHBOARD) e colunas que não fazem
+    parte do schema são mantidas como estão. O número de valores que não
+    puderam ser convertidos em cada coluna fica em df.attrs['falhas_conversao'].
+
+    Args:
+        df (DataFrame): DataFrame com as colunas da base (nomes do ETL).
+        dayfirst (bool): Se as datas em texto estão no formato dia/mês/ano.
+
+    Returns:
+        DataFrame: Novo DataFrame com os tipos aplicados.
+    """
+    # Cópia rasa: as colunas convertidas são substituídas, as demais continuam compartilhando memória
+    df = df.copy(deep=False)
+    falhas = {}
+    for coluna, tipo in COLUNAS.items():
+        if coluna not in df.columns or df[coluna].dtype in (tipo, TIPOS_DASHBOARD.get(tipo, tipo)):
+            continue
+        if tipo == DATA:
+            df[coluna], falhas[coluna] = converter_datas(df[coluna], dayfirst=dayfirst, chave=coluna)
+        elif tipo in (NUMERO, INTEIRO):
+            numeros, falhas[coluna] = converter_numeros(df[coluna])
+            df[coluna] = numeros.astype(tipo)
+        else:
+            df[coluna] = df[coluna].astype(object).where(df[coluna].notna(), '').astype(str).astype(tipo)
+    df.attrs['falhas_conversao'] = {coluna: total for coluna, total in falhas.items() if total > 0}
+    return df
+
+
+def preparar_para_dashboard(df):
+    """
+    Aplica o schema e os nomes de colunas usados pelos dashboards, e cria a coluna 'Ano'.
+
+    Números, datas e inteiros ficam nos tipos de TIPOS_DASHBOARD, os mesmos da base lida do
+    snapshot ou da memória compartilhada, qualquer que seja a fonte.
+
+    Args:
+        df (DataFrame): DataFrame com as colunas da base (nomes do ETL).
+
+    Returns:
+        DataFrame: DataFrame pronto para uso nos dashboards.
+    """
+    df = aplicar_schema(df)
+    for coluna, tipo in COLUNAS.items():
+        if coluna in df.columns and tipo in TIPOS_DASHBOARD:
+            df[coluna] = df[coluna].astype(TIPOS_DASHBOARD[tipo])
+    df = df.rename(columns=RENOMEAR_DASHBOARD, copy=False)
+    df['Ano'] = df['Criado em'].dt.year.astype(ANO)
+    return df
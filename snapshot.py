@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Snapshot local da base publicado pelo ETL e lido pelos dashboards, em formato Arrow IPC
+# (sem compressão, para poder ser lido por memory map) e acompanhado de um manifesto
+
+# Diretório onde os snapshots e o manifesto são gravados
+SNAPSHOT_DIR = os.getenv('CRM_SNAPSHOT_DIR', os.path.join('data', 'snapshot'))
+# Quantidade de versões mantidas no diretório (as mais antigas são apagadas)
+VERSOES_MANTIDAS = 3
+# Textos lidos do Arrow continuam no formato do pyarrow (sem isso, o pandas os converte em objetos Python)
+TIPOS_PANDAS = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+
+
+def tipo_pandas(tipo):
+    # Inteiros com valores ausentes (ex.: 'Código' e 'Ano') continuam em arrays do Arrow; convertidos para
+    # Int64/Int16, eles seriam copiados para montar a máscara de ausentes
+    if pa.types.is_integer(tipo):
+        return pd.ArrowDtype(tipo)
+    return TIPOS_PANDAS.get(tipo)
+
+
+def para_pandas(tabela):
+    # Converte a tabela Arrow em DataFrame: textos e inteiros continuam no Arrow (ver tipo_pandas), e números
+    # e datas gravados sem nulos (ver para_arrow) viram arrays do numpy que apontam para os mesmos dados;
+    # split_blocks evita juntar as colunas numéricas em blocos (o que exigiria cópia)
+    return tabela.to_pandas(split_blocks=True, types_mapper=tipo_pandas)
+
+
+def para_arrow(df):
+    """
+    Converte o DataFrame em tabela Arrow, com números e datas sem valores nulos.
+
+    Números ausentes são gravados como NaN e datas ausentes como NaT, como no numpy. Com nulos, o
+    Arrow guarda os ausentes em uma máscara separada, e a leitura para float64 ou datetime64 (ou
+    Float64) precisa copiar a coluna para preenchê-los; sem nulos, a leitura não copia os dados.
+
+    Args:
+        df (DataFrame): DataFrame a gravar.
+
+    Returns:
+        Table: Tabela Arrow, com os metadados do pandas apontando para float64 e datetime64[ns].
+    """
+    df = df.copy(deep=False)
+    sem_nulos = {}
+    for coluna in df.columns:
+        tipo = df[coluna].dtype
+        if pd.api.types.is_float_dtype(tipo):
+            df[coluna] = df[coluna].to_numpy(dtype='float64', na_value=np.nan)
+            sem_nulos[coluna] = pa.array(df[coluna].to_numpy(), from_pandas=False)
+        elif pd.api.types.is_datetime64_any_dtype(tipo) and getattr(tipo, 'tz', None) is None:
+            df[coluna] = df[coluna].to_numpy(dtype='datetime64[ns]', na_value=np.datetime64('NaT'))
+            sem_nulos[coluna] = pa.array(df[coluna].to_numpy().view('int64')).cast(pa.timestamp('ns'))
+    # O schema (com os metadados do pandas) vem do DataFrame convertido; as colunas sem nulos o substituem
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    for coluna, array in sem_nulos.items():
+        posicao = tabela.schema.get_field_index(coluna)
+        tabela = tabela.set_column(posicao, tabela.schema.field(posicao), array)
+    return tabela
+
+
+def calcular_checksum(caminho):
+    # Calcula o SHA-256 do arquivo, lendo em blocos
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            sha256.update(bloco)
+    return sha256.hexdigest()
+
+
+def ler_manifesto(diretorio=SNAPSHOT_DIR):
+    """
+    Lê o manifesto do snapshot mais recente.
+
+    Args:
+        diretorio (str): Diretório dos snapshots.
+
+    Returns:
+        dict: Manifesto com 'versao', 'arquivo', 'linhas', 'checksum', 'criado_em' e 'extras', ou None se não existir.
+    """
+    caminho = os.path.join(diretorio, 'manifesto.json')
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho) as f:
+        return json.load(f)
+
+
+def gravar_arrow(df, caminho):
+    # Grava o DataFrame em Arrow IPC em um arquivo temporário e depois o substitui
+    tabela = para_arrow(df)
+    with pa.OSFile(caminho + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, tabela.schema) as writer:
+            writer.write_table(tabela)
+    os.replace(caminho + '.tmp', caminho)
+    return tabela
+
+
+def publicar_snapshot(df, diretorio=SNAPSHOT_DIR, extras=None, versao=None):
+    """
+    Grava o DataFrame como uma nova versão do snapshot e atualiza o manifesto.
+
+    O arquivo e o manifesto são escritos em arquivos temporários e depois substituídos,
+    para que os leitores nunca vejam uma versão pela metade.
+
+    Args:
+        df (DataFrame): Base tratada (com o schema aplicado).
+        diretorio (str): Diretório dos snapshots.
+        extras (dict): Tabelas derivadas da base publicadas na mesma versão (ex.: {'cubo': cubo}).
+        versao (str): Versão dos dados (ex.: a publicada pelo ETL na planilha). Por padrão, a data e hora atuais.
+
+    Returns:
+        dict: Manifesto da versão publicada.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    criado_em = pd.Timestamp.now()
+    if versao is None:
+        versao = criado_em.strftime('%Y%m%dT%H%M%S')
+    arquivo = f'crm_{versao}.arrow'
+    caminho = os.path.join(diretorio, arquivo)
+
+    tabela = gravar_arrow(df, caminho)
+
+    # As tabelas derivadas são gravadas antes do manifesto, para que já existam quando ele apontar para a versão
+    arquivos_extras = {}
+    for nome, extra in (extras or {}).items():
+        arquivos_extras[nome] = f'{nome}_{versao}.arrow'
+        gravar_arrow(extra, os.path.join(diretorio, arquivos_extras[nome]))
+
+    manifesto = {
+        'versao': versao,
+        'arquivo': arquivo,
+        'linhas': tabela.num_rows,
+        'checksum': calcular_checksum(caminho),
+        'criado_em': criado_em.isoformat(),
+        'extras': arquivos_extras,
+    }
+    caminho_manifesto = os.path.join(diretorio, 'manifesto.json')
+    with open(caminho_manifesto + '.tmp', 'w') as f:
+        json.dump(manifesto, f)
+    os.replace(caminho_manifesto + '.tmp', caminho_manifesto)
+
+    # Apaga as versões mais antigas, com as suas tabelas derivadas (as versões ordenam por data)
+    def versao_do_arquivo(nome):
+        return nome[:-len('.arrow')].rsplit('_', 1)[-1]
+    arquivos = [nome for nome in os.listdir(diretorio) if nome.endswith('.arrow')]
+    versoes = sorted(versao_do_arquivo(nome) for nome in arquivos if nome.startswith('crm_'))
+    antigas = set(versoes[:-VERSOES_MANTIDAS])
+    for nome in arquivos:
+        if versao_do_arquivo(nome) in antigas:
+            os.remove(os.path.join(diretorio, nome))
+
+    return manifesto
+
+
+def carregar_snapshot(diretorio=SNAPSHOT_DIR, verificar=False):
+    """
+    Lê a versão mais recente do snapshot por memory map.
+
+    Categorias e textos são restaurados a partir dos metadados do pandas gravados no arquivo; números,
+    datas e inteiros ficam nos tipos que a leitura não copia (ver schema.TIPOS_DASHBOARD).
+
+    Args:
+        diretorio (str): Diretório dos snapshots.
+        verificar (bool): Se o checksum do arquivo deve ser conferido (lê o arquivo inteiro).
+
+    Returns:
+        tuple: (DataFrame, manifesto), ou None se não houver snapshot válido.
+    """
+    manifesto = ler_manifesto(diretorio)
+    if manifesto is None:
+        return None
+    caminho = os.path.join(diretorio, manifesto['arquivo'])
+    if not os.path.exists(caminho):
+        return None
+    if verificar and calcular_checksum(caminho) != manifesto['checksum']:
+        print(f"Checksum inválido no snapshot {manifesto['versao']}.")
+        return None
+
+    with pa.memory_map(caminho, 'r') as fonte:
+        tabela = pa.ipc.open_file(fonte).read_all()
+    if tabela.num_rows != manifesto['linhas']:
+        print(f"Número de linhas inválido no snapshot {manifesto['versao']}.")
+        return None
+
+    return para_pandas(tabela), manifesto
+
+
+def carregar_extra(nome, manifesto, diretorio=SNAPSHOT_DIR):
+    """
+    Lê por memory map uma tabela derivada publicada junto com a versão do manifesto.
+
+    Args:
+        nome (str): Nome da tabela (chave de 'extras' no manifesto, ex.: 'cubo').
+        manifesto (dict): Manifesto da versão desejada.
+        diretorio (str): Diretório dos snapshots.
+
+    Returns:
+        DataFrame: Tabela derivada, ou None se ela não foi publicada nessa versão.
+    """
+    arquivo = manifesto.get('extras', {}).get(nome)
+    if arquivo is None:
+        return None
+    try:
+        with pa.memory_map(os.path.join(diretorio, arquivo), 'r') as fonte:
+            tabela = pa.ipc.open_file(fonte).read_all()
+    except FileNotFoundError:
+        return None
+    return para_pandas(tabela)
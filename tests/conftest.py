@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# Os módulos do projeto ficam na raiz do repositório (sem pacote instalável)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Snapshot e memória compartilhada em diretórios temporários, para que os testes não leiam nem gravem
+# os dados da máquina (as variáveis precisam existir antes da importação de snapshot.py e dataset_compartilhado.py)
+_diretorio_testes = tempfile.mkdtemp(prefix='crm_testes_')
+os.environ.setdefault('CRM_SNAPSHOT_DIR', os.path.join(_diretorio_testes, 'snapshot'))
+os.environ.setdefault('CRM_SHM_DIR', os.path.join(_diretorio_testes, 'compartilhado'))
@@ -0,0 +1,84 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from schema import preparar_para_dashboard
+from utils import carregar_ponte, construir_indice, filtrar_base
+
+VENDEDORES = ['Ana Maria de Souza', 'Bruno Lima', 'Carla Dias Costa', 'Ana Maria de Souza, Bruno Lima', '']
+FASES = ['Ganho', 'Perdido', 'Qualificação', 'Negociação']
+
+
+@pytest.fixture(scope='module')
+def base_versao():
+    rng = np.random.default_rng(0)
+    total = 600
+    criado_em = pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 1000, total), unit='D')
+    dados = pd.DataFrame({
+        'Fase atual': np.array(FASES)[rng.integers(0, len(FASES), total)],
+        'Criado em': pd.Series(criado_em).where(rng.random(total) > 0.05),  # alguns cards sem data
+        'Nome do cliente': [f'Cliente {i}' for i in range(total)],
+        'Empresa': [f'Empresa {i % 50}' for i in range(total)],
+        'Responsável': np.array(VENDEDORES)[rng.integers(0, len(VENDEDORES), total)],
+        'Checklist vertical': 'Design',
+        'Valor Final': rng.uniform(1000, 5000, total),
+    })
+    # Versão exclusiva deste módulo, para não reaproveitar tabelas derivadas de outra base
+    return preparar_para_dashboard(dados), 'teste-filtrar-base'
+
+
+def posicoes_esperadas(base_versao, ano, vendedor, fase):
+    # Filtro direto, linha a linha, para comparar com o resultado do índice
+    base = base_versao[0]
+    selecionadas = np.ones(len(base), dtype=bool)
+    if ano is not None:
+        selecionadas &= (base['Ano'] == ano).to_numpy(dtype=bool, na_value=False)
+    if fase is not None:
+        selecionadas &= (base['Fase atual'] == fase).to_numpy(dtype=bool, na_value=False)
+    if vendedor is not None:
+        ponte = carregar_ponte('Vendedor', base_versao)
+        do_vendedor = np.zeros(len(base), dtype=bool)
+        do_vendedor[ponte['linha'][ponte['Vendedor'] == vendedor].to_numpy()] = True
+        selecionadas &= do_vendedor
+    return set(np.flatnonzero(selecionadas))
+
+
+def test_indice_guarda_posicoes_ordenadas_pelas_chaves(base_versao):
+    base = base_versao[0]
+    ponte = carregar_ponte('Vendedor', base_versao)
+
+    indice = construir_indice(base, ponte)
+
+    assert np.all(np.diff(indice['chaves_cards']) >= 0)
+    assert np.all(np.diff(indice['chaves_vendedores']) >= 0)
+    # Cada card aparece uma vez na ordem por (ano, fase) e uma vez por vendedor na ordem por (ano, vendedor, fase)
+    assert np.array_equal(np.sort(indice['cards']), np.arange(len(base)))
+    assert np.array_equal(np.sort(indice['vendedores']), np.sort(ponte['linha'].to_numpy()))
+
+
+@pytest.mark.parametrize('ano, vendedor, fase', list(itertools.product(
+    [None, 2022, 2024, 1999],
+    [None, 'Ana Maria', 'Bruno Lima', 'Vendedor Inexistente'],
+    [None, 'Ganho', 'Fase Inexistente'],
+)))
+def test_filtro_pelo_indice_igual_ao_filtro_direto(base_versao, ano, vendedor, fase):
+    fatia = filtrar_base(ano=ano, vendedor=vendedor, fase=fase, base_versao=base_versao)
+
+    # O índice da fatia traz a posição de cada card na base, sem repetições
+    assert fatia.index.is_unique
+    assert set(fatia.index) == posicoes_esperadas(base_versao, ano, vendedor, fase)
+    # As linhas são as da base (com vendedor, só a coluna 'Vendedor' muda)
+    colunas = [coluna for coluna in fatia.columns if coluna != 'Vendedor']
+    assert fatia[colunas].equals(base_versao[0][colunas].take(fatia.index))
+
+
+def test_filtro_por_vendedor_traz_o_nome_curto(base_versao):
+    fatia = filtrar_base(vendedor='Ana Maria', base_versao=base_versao)
+
+    assert len(fatia) > 0
+    assert (fatia['Vendedor'] == 'Ana Maria').all()
+    # Os demais campos vêm da base
+    base = base_versao[0]
+    assert fatia['Nome do cliente'].tolist() == base['Nome do cliente'].take(fatia.index).tolist()
@@ -0,0 +1,83 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from ETL import identificar_cards, mesclar_fontes
+
+
+def pipefy(codigos, nomes, empresas, datas):
+    return pd.DataFrame({
+        'Código': codigos,
+        'Nome do cliente': nomes,
+        'Empresa': empresas,
+        'Criado em': pd.to_datetime(datas),
+    })
+
+
+def base23(nomes, empresas, datas):
+    return pd.DataFrame({
+        'Nome do cliente': nomes,
+        'Empresa': empresas,
+        'Criado em': pd.to_datetime(datas),
+    })
+
+
+def test_cards_do_pipefy_sao_deduplicados_apenas_pelo_codigo():
+    # Cards distintos com nome, empresa e data vazios ou iguais não podem ser confundidos
+    relatorio = pipefy(
+        [1, 2, 3, 4, 4],
+        [None, None, 'Ana', 'Ana', 'Ana'],
+        [None, None, 'Empresa', 'Empresa', 'Empresa'],
+        [None, None, '2024-01-01', '2024-01-01', '2024-01-01'],
+    )
+
+    mesclada = mesclar_fontes([relatorio, base23([], [], [])])
+
+    assert sorted(mesclada['Código']) == [1, 2, 3, 4]
+
+
+def test_card_da_base23_repetido_no_pipefy_e_descartado():
+    relatorio = pipefy([1], ['Ana'], ['Empresa'], ['2023-03-05 10:00:00'])
+    antigos = base23(['  ana ', 'Bruno'], ['EMPRESA', 'Outra'], ['2023-03-05 10:00:00', '2023-04-01 00:00:00'])
+
+    mesclada = mesclar_fontes([relatorio, antigos])
+
+    assert len(mesclada) == 2
+    assert mesclada['Nome do cliente'].tolist() == ['Ana', 'Bruno']
+
+
+def test_cards_da_base23_sem_chave_completa_sao_mantidos():
+    relatorio = pipefy([1], ['Ana'], ['Empresa'], ['2023-03-05'])
+    # Linhas repetidas na própria Base23 e linhas com campos vazios não são descartadas
+    antigos = base23(['Ana', 'Bruno', 'Bruno', None], ['', 'Outra', 'Outra', 'Empresa'],
+                     ['2023-03-05', '2023-04-01', '2023-04-01', '2023-03-05'])
+
+    mesclada = mesclar_fontes([relatorio, antigos])
+
+    assert len(mesclada) == 5
+
+
+def test_resultado_fica_ordenado_por_data_com_datas_vazias_no_fim():
+    relatorio = pipefy([1, 2, 3], ['A', 'B', 'C'], ['X', 'Y', 'Z'], ['2024-01-03', None, '2024-01-01'])
+    antigos = base23(['D', 'E'], ['W', 'V'], ['2024-01-02', None])
+
+    mesclada = mesclar_fontes([relatorio, antigos])
+
+    assert mesclada['Nome do cliente'].tolist() == ['C', 'D', 'A', 'B', 'E']
+
+
+def test_particoes_vazias_nao_geram_avisos():
+    relatorio = pipefy([1], ['Ana'], ['Empresa'], ['2024-01-01'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        assert len(mesclar_fontes([relatorio, base23([], [], [])])) == 1
+        assert len(mesclar_fontes([relatorio.iloc[0:0], base23([], [], [])])) == 0
+
+
+def test_identificacao_marca_chaves_incompletas_como_invalidas():
+    codigos, chaves, validas = identificar_cards(base23(['Ana', 'Ana', ''], ['X', 'x ', 'X'], ['2024-01-01'] * 3))
+
+    assert np.isnan(codigos).all()
+    assert validas.tolist() == [True, True, False]
+    assert chaves[0] == chaves[1]
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import parsing
+from parsing import converter_datas, converter_numeros
+
+
+@pytest.fixture(autouse=True)
+def limpar_formatos_guardados():
+    # Cada teste começa sem formatos de data guardados de conversões anteriores
+    parsing._formatos_por_coluna.clear()
+    yield
+    parsing._formatos_por_coluna.clear()
+
+
+def test_numeros_em_ptbr_e_enus():
+    numeros, falhas = converter_numeros(pd.Series(['1.234,5', '13,676065', 'R$ 2.000,00', '-3', '1,5E-05']))
+
+    np.testing.assert_allclose(numeros, [1234.5, 13.676065, 2000.0, -3.0, 1.5e-05])
+    assert falhas == 0
+
+
+def test_numeros_ambiguos_seguem_o_formato_predominante():
+    # '1.234' segue os dois formatos: vale o en-US, predominante na coluna
+    numeros, _ = converter_numeros(pd.Series(['1.234', '10.5', '2,000.25']))
+    np.testing.assert_allclose(numeros, [1.234, 10.5, 2000.25])
+
+    # Em caso de empate, vale o padrão informado
+    assert converter_numeros(pd.Series(['1.234']))[0].iloc[0] == 1234
+    assert converter_numeros(pd.Series(['1.234']), padrao='en-US')[0].iloc[0] == pytest.approx(1.234)
+
+
+def test_numeros_invalidos_sao_contados_como_falhas():
+    numeros, falhas = converter_numeros(pd.Series(['12', 'abc', '', None]))
+
+    assert numeros.iloc[0] == 12
+    assert numeros.iloc[1:].isna().all()
+    assert falhas == 1
+
+
+def test_datas_dia_primeiro_e_iso():
+    datas, falhas = converter_datas(pd.Series(['05/03/2024', '2024-03-06 10:00:00', '25/12/2023 08:30']),
+                                    dayfirst=True)
+
+    assert datas.tolist() == [pd.Timestamp('2024-03-05'), pd.Timestamp('2024-03-06 10:00'), pd.Timestamp('2023-12-25 08:30')]
+    assert falhas == 0
+
+
+def test_datas_mes_primeiro():
+    datas, _ = converter_datas(pd.Series(['05/03/2024', '12/31/2023']), dayfirst=False)
+
+    assert datas.tolist() == [pd.Timestamp('2024-05-03'), pd.Timestamp('2023-12-31')]
+
+
+def test_datas_fora_da_ordem_indicada_usam_a_outra_ordem():
+    # Na coluna em dia/mês, um valor com mês maior que 12 na segunda posição só pode ser mês/dia
+    datas, falhas = converter_datas(pd.Series(['05/03/2024', '20/03/2024', '01/13/2024']), dayfirst=True)
+
+    assert datas.tolist() == [pd.Timestamp('2024-03-05'), pd.Timestamp('2024-03-20'), pd.Timestamp('2024-01-13')]
+    assert falhas == 0
+
+
+def test_amostra_ambigua_nao_usa_formato_guardado_da_ordem_oposta():
+    # Uma conversão anterior só com valores mês/dia guarda esse formato para a coluna...
+    converter_datas(pd.Series(['01/13/2024', '02/14/2024']), dayfirst=True, chave='Criado em')
+    # ...mas uma amostra ambígua (dias até 12) volta para a ordem indicada por dayfirst
+    datas, _ = converter_datas(pd.Series(['05/03/2024', '02/01/2024']), dayfirst=True, chave='Criado em')
+
+    assert datas.tolist() == [pd.Timestamp('2024-03-05'), pd.Timestamp('2024-01-02')]
+
+
+def test_datas_invalidas_sao_contadas_como_falhas():
+    datas, falhas = converter_datas(pd.Series(['2024-01-01', 'ontem', '', None]), dayfirst=True)
+
+    assert datas.iloc[0] == pd.Timestamp('2024-01-01')
+    assert datas.iloc[1:].isna().all()
+    assert falhas == 1
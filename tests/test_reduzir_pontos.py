@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from utils import reduzir_pontos
+
+
+def serie(valores, inicio='2024-01-01'):
+    return pd.DataFrame({'x': pd.date_range(inicio, periods=len(valores), freq='D'), 'y': valores})
+
+
+def test_series_pequenas_nao_sao_reduzidas():
+    dados = serie(np.arange(10.0))
+
+    assert reduzir_pontos(dados, 'x', 'y', 10) is dados
+    assert reduzir_pontos(dados, 'x', 'y', None) is dados
+
+
+def test_reducao_mantem_extremos_e_ordem():
+    dados = serie(np.random.default_rng(0).normal(size=1000).cumsum())
+
+    reduzida = reduzir_pontos(dados, 'x', 'y', 50)
+
+    assert len(reduzida) == 50
+    assert reduzida['x'].iloc[0] == dados['x'].iloc[0]
+    assert reduzida['x'].iloc[-1] == dados['x'].iloc[-1]
+    assert reduzida['x'].is_monotonic_increasing and reduzida['x'].is_unique
+    # Apenas pontos da série original são mantidos
+    assert reduzida.merge(dados, on=['x', 'y']).shape[0] == 50
+
+
+def test_picos_isolados_sao_preservados():
+    valores = np.zeros(1000)
+    valores[[137, 612]] = [100.0, -80.0]
+
+    reduzida = reduzir_pontos(serie(valores), 'x', 'y', 20)
+
+    assert reduzida['y'].max() == 100.0
+    assert reduzida['y'].min() == -80.0
+
+
+def test_eixo_numerico():
+    dados = pd.DataFrame({'x': np.arange(500), 'y': np.sin(np.arange(500) / 20)})
+
+    reduzida = reduzir_pontos(dados, 'x', 'y', 100)
+
+    assert len(reduzida) == 100
+    assert reduzida['x'].tolist()[0] == 0 and reduzida['x'].tolist()[-1] == 499
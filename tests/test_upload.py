@@ -0,0 +1,50 @@
+from ETL import calcular_blocos_alterados, planejar_alteracoes
+
+CABECALHO = ['Código', 'Nome do cliente', 'Empresa', 'Criado em', 'Fase atual']
+
+
+def test_blocos_agrupam_linhas_alteradas_contiguas():
+    atuais = [CABECALHO, [1, 'A', 'X', '2024-01-01', 'Ganho'], [2, 'B', 'Y', '2024-01-02', 'Perdido'],
+              [3, 'C', 'Z', '2024-01-03', 'Ganho'], [4, 'D', 'W', '2024-01-04', 'Ganho']]
+    linhas = [list(linha) for linha in atuais]
+    linhas[2][4] = 'Ganho'
+    linhas[3][4] = 'Perdido'
+    linhas.append([5, 'E', 'V', '2024-01-05', 'Ganho'])
+
+    assert calcular_blocos_alterados(atuais, linhas) == [(2, [linhas[2], linhas[3]]), (5, [linhas[5]])]
+
+
+def test_blocos_ignoram_celulas_vazias_omitidas_no_fim_da_linha():
+    # O Sheets não devolve as células vazias do final da linha
+    atuais = [CABECALHO, [1, 'A', 'X', '2024-01-01']]
+    linhas = [CABECALHO, [1, 'A', 'X', '2024-01-01', '']]
+
+    assert calcular_blocos_alterados(atuais, linhas) == []
+
+
+def test_alteracoes_por_codigo_independem_da_posicao():
+    atuais = [CABECALHO, [1, 'A', 'X', '2024-01-01', 'Ganho'], [2, 'B', 'Y', '2024-01-02', 'Perdido'],
+              [3, 'C', 'Z', '2024-01-03', 'Ganho']]
+    # Card 1 removido, card 3 alterado, card 4 novo, e a ordem das linhas mudou
+    linhas = [CABECALHO, [3, 'C', 'Z', '2024-01-03', 'Perdido'], [4, 'D', 'W', '2024-01-04', 'Ganho'],
+              [2, 'B', 'Y', '2024-01-02', 'Perdido']]
+
+    blocos, removidas, novas = planejar_alteracoes(atuais, linhas)
+
+    assert blocos == [(3, [[3, 'C', 'Z', '2024-01-03', 'Perdido']])]
+    assert removidas == [1]
+    assert novas == [[4, 'D', 'W', '2024-01-04', 'Ganho']]
+
+
+def test_alteracoes_de_cards_sem_codigo_usam_nome_empresa_e_data():
+    atuais = [CABECALHO, ['', 'A', 'X', '2023-05-01', 'Ganho'], ['', 'A', 'X', '2023-05-01', 'Perdido'],
+              ['', 'B', 'Y', '2023-06-01', 'Ganho']]
+    # Chaves repetidas são associadas pela ordem de ocorrência
+    linhas = [CABECALHO, ['', 'A', 'X', '2023-05-01', 'Ganho'], ['', 'A', 'X', '2023-05-01', 'Ganho'],
+              ['', 'B', 'Y', '2023-06-01', 'Ganho']]
+
+    blocos, removidas, novas = planejar_alteracoes(atuais, linhas)
+
+    assert blocos == [(2, [['', 'A', 'X', '2023-05-01', 'Ganho']])]
+    assert removidas == []
+    assert novas == []
@@ -0,0 +1,32 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Trava entre os processos da mesma máquina (réplicas do Streamlit e workers do gunicorn), por arquivo,
+# usada na carga da base compartilhada (dataset_compartilhado.py) e no registro do assistant (assistente.py)
+
+
+@contextmanager
+def trava_arquivo(caminho):
+    """
+    Garante que apenas um processo por vez execute o trecho protegido, com uma trava exclusiva (flock) no arquivo.
+
+    Sem fcntl (Windows), não há trava: cada processo executa o trecho por conta própria.
+
+    Args:
+        caminho (str): Arquivo da trava (criado se não existir).
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    with open(caminho, 'w') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(trava, fcntl.LOCK_UN)
@@ -1,3 +1,10 @@
+import threading
+import time
+from collections import OrderedDict
+from difflib import get_close_matches
+from functools import wraps
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 import altair as alt
@@ -5,8 +12,496 @@ import altair as alt
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from gspread_dataframe import set_with_dataframe, get_as_dataframe
+from schema import COLUNAS_TEMPO, aplicar_schema, preparar_para_dashboard
+from snapshot import carregar_snapshot, carregar_extra, ler_manifesto, publicar_snapshot
+from cubo import construir_cubo, construir_cubo_explodido, construir_tabelas_derivadas, agregar_cubo, fatiar_cubo
+from pontes import CAMPOS_MULTIVALORADOS, NOMES_TABELAS, chave_nome, construir_ponte
+from metricas import MEDIDAS, calcular_metricas
+from dataset_compartilhado import anexar_dataset, publicar_dataset, trava_carga
+
+# Cache da base compartilhado por todas as páginas e sessões do processo
+TTL_BASE = 300  # Segundos entre as verificações, em segundo plano, de uma nova versão da base
+# Aba da planilha em que o ETL publica a versão dos dados da aba 'Upload' (ver ETL.publicar_versao_planilha)
+ABA_VERSAO = 'Versao'
+_cache_base = {'df': None, 'versao': None, 'carregado_em': 0.0, 'atualizando': False}
+_estatisticas_cache = {'acertos': 0, 'falhas': 0, 'atualizacoes': 0}
+_lock_base = threading.Lock()
+# Serializa a primeira carga do processo, feita fora do _lock_base (que não é mantido durante o acesso à rede)
+_lock_primeira_carga = threading.Lock()
+# Tabelas derivadas (cubos, pontes e índices) por versão da base, da menos para a mais recente
+_cache_derivadas = OrderedDict()
+# Versões mantidas: a atual e a anterior, ainda usada por quem obteve a base antes da troca de versão
+VERSOES_DERIVADAS = 2
+# Resultados memorizados dos cálculos dos dashboards, do menos para o mais recentemente usado
+TAMANHO_MEMO = 256  # Quantidade máxima de resultados guardados
+_memo = OrderedDict()
+_lock_memo = threading.Lock()
+# Quantidade máxima de pontos das séries temporais enviadas aos gráficos
+MAX_PONTOS_GRAFICO = 500
+# Quantidade máxima de leads oferecidos na busca de leads
+LIMITE_LEADS = 50
 
 def carregar_base():
+    """
+    Carrega a base do CRM para os dashboards, usando um cache compartilhado pelo processo.
+
+    A primeira chamada lê a base da fonte; as seguintes devolvem a versão em cache. Quando o ETL
+    publica uma nova versão do snapshot (ou, sem snapshot, quando o TTL expira), a base é
+    recarregada em segundo plano e a versão anterior continua sendo servida até lá.
+
+    Returns:
+        DataFrame: Base pronta para uso nos dashboards.
+    """
+    carregou = _cache_base['df'] is None and carregar_primeira_vez()
+    with _lock_base:
+        if not carregou:
+            _estatisticas_cache['acertos'] += 1
+        if not _cache_base['atualizando'] and base_desatualizada():
+            _cache_base['atualizando'] = True
+            threading.Thread(target=atualizar_cache_base, daemon=True).start()
+        df = _cache_base['df']
+
+    # Cópia rasa, para que as páginas possam criar ou substituir colunas sem alterar o cache
+    return df.copy(deep=False)
+
+def carregar_primeira_vez():
+    # Primeira carga do processo: não há versão anterior para servir, então as outras chamadas esperam por ela.
+    # Usa a versão disponível na máquina (sem consultar a planilha, se houver uma) e agenda a verificação da
+    # versão publicada pelo ETL, em segundo plano. Retorna True se a base foi carregada por esta chamada
+    with _lock_primeira_carga:
+        if _cache_base['df'] is not None:
+            return False
+        df, versao = carregar_base_fonte()
+        with _lock_base:
+            _estatisticas_cache['falhas'] += 1
+            _cache_base['df'], _cache_base['versao'] = df, versao
+            _cache_base['carregado_em'] = 0.0  # Considerada vencida: a verificação começa logo em seguida
+        return True
+
+def base_desatualizada():
+    # Verificação barata de atualização, sem acessar a planilha: o snapshot local mudou (ex.: gravado por outro
+    # processo) ou já passou o TTL, e a versão publicada pelo ETL deve ser conferida em segundo plano
+    manifesto = ler_manifesto()
+    if manifesto is not None and manifesto['versao'] != _cache_base['versao']:
+        return True
+    return time.monotonic() - _cache_base['carregado_em'] > TTL_BASE
+
+def atualizar_cache_base():
+    # Recarrega a base em segundo plano e troca a versão em cache de uma só vez. A versão publicada na planilha
+    # só é consultada quando o snapshot local não tem uma versão nova (verificação periódica, ao fim do TTL)
+    try:
+        manifesto = ler_manifesto()
+        snapshot_novo = manifesto is not None and manifesto['versao'] != _cache_base['versao']
+        df, versao = carregar_base_fonte(consultar_planilha=not snapshot_novo)
+        with _lock_base:
+            # Na mesma versão, mantém o DataFrame em cache (e os resultados calculados a partir dele)
+            if versao != _cache_base['versao']:
+                _cache_base['df'], _cache_base['versao'] = df, versao
+                _estatisticas_cache['atualizacoes'] += 1
+            _cache_base['carregado_em'] = time.monotonic()
+    except Exception as e:
+        print(f"Erro ao atualizar a base em segundo plano: {e}")
+    finally:
+        with _lock_base:
+            _cache_base['atualizando'] = False
+
+def versao_base():
+    # Versão da base atualmente em cache
+    return _cache_base['versao']
+
+def carregar_base_versao():
+    # Base em cache e a sua versão, obtidas juntas: com a troca de versão em segundo plano, duas chamadas
+    # separadas (carregar_base e versao_base) podem devolver versões diferentes
+    carregar_base()
+    with _lock_base:
+        return _cache_base['df'].copy(deep=False), _cache_base['versao']
+
+def estatisticas_cache():
+    # Acertos, falhas e atualizações em segundo plano do cache da base
+    return dict(_estatisticas_cache)
+
+def carregar_cubo(explodir=None, base_versao=None):
+    """
+    Carrega o cubo agregado da base (ver cubo.py) na mesma versão da base em cache.
+
+    Args:
+        explodir (str): Campo com mais de um valor por card ('Vendedor' ou 'Serviço') que deve ter
+            um único valor por linha no cubo. Por padrão, o cubo mantém os rótulos como estão na base.
+        base_versao (tuple): (base, versão) a que o cubo deve corresponder (ver carregar_tabela_derivada).
+
+    Returns:
+        DataFrame: Cubo com as dimensões e medidas definidas em cubo.py.
+    """
+    if explodir is None:
+        return carregar_tabela_derivada('cubo', construir_cubo, MEDIDAS, base_versao)
+    base_versao = base_versao or carregar_base_versao()
+    def construir(base):
+        return construir_cubo_explodido(base, carregar_ponte(explodir, base_versao))
+    return carregar_tabela_derivada(f'cubo_{NOMES_TABELAS[explodir]}', construir, MEDIDAS, base_versao)
+
+def carregar_ponte(campo, base_versao=None):
+    """
+    Carrega a tabela ponte de um campo com mais de um valor por card (ver pontes.py).
+
+    Args:
+        campo (str): 'Vendedor' ou 'Serviço'.
+        base_versao (tuple): (base, versão) a que a ponte deve corresponder (ver carregar_tabela_derivada).
+
+    Returns:
+        DataFrame: Colunas 'linha' (posição do card na base) e o campo (categórico).
+    """
+    def construir(base):
+        return construir_ponte(base[campo], CAMPOS_MULTIVALORADOS[campo])
+    return carregar_tabela_derivada(f'ponte_{NOMES_TABELAS[campo]}', construir, ['linha', campo], base_versao)
+
+def carregar_tabela_derivada(nome, construir, colunas, base_versao=None):
+    """
+    Carrega uma tabela derivada da base (cubo, ponte ou índice) na mesma versão da base.
+
+    Usa a tabela publicada pelo ETL junto com o snapshot e, se ela não existir (ex.: base lida do
+    Google Sheets), constrói a tabela a partir da base uma única vez por versão.
+
+    Args:
+        nome (str): Nome da tabela no manifesto do snapshot (ex.: 'cubo').
+        construir (callable): Função que constrói a tabela a partir da base.
+        colunas (list): Colunas obrigatórias (tabelas publicadas sem elas são reconstruídas).
+        base_versao (tuple): (base, versão) obtidos por carregar_base_versao, quando a tabela precisa
+            corresponder a uma base já obtida. Por padrão, usa a base em cache.
+
+    Returns:
+        DataFrame: Tabela derivada.
+    """
+    base, versao = base_versao or carregar_base_versao()
+    with _lock_base:
+        tabelas = _cache_derivadas.setdefault(versao, {})
+        _cache_derivadas.move_to_end(versao)
+        while len(_cache_derivadas) > VERSOES_DERIVADAS:
+            _cache_derivadas.popitem(last=False)
+        if nome in tabelas:
+            return tabelas[nome]
+
+    tabela = None
+    manifesto = ler_manifesto()
+    if manifesto is not None and manifesto['versao'] == versao:
+        tabela = carregar_extra(nome, manifesto)
+    # Tabelas publicadas antes de novas colunas serem adicionadas são reconstruídas
+    if tabela is None or not set(colunas).issubset(tabela.columns):
+        tabela = construir(base)
+    with _lock_base:
+        tabelas[nome] = tabela
+    return tabela
+
+def construir_indice(base, ponte_vendedores):
+    """
+    Constrói o índice da base para os filtros por ano, vendedor e fase.
+
+    O índice guarda apenas posições de cards na base, em duas ordens, cada uma com a chave de
+    ordenação em inteiros: 'cards', ordenada por (ano, fase), e 'vendedores', com uma posição por
+    par (card, vendedor) da tabela ponte, ordenada por (ano, vendedor, fase). Assim, cada combinação
+    de filtros corresponde a um intervalo contíguo de posições, e só as linhas filtradas são copiadas
+    da base.
+
+    Args:
+        base (DataFrame): Base pronta para uso nos dashboards.
+        ponte_vendedores (DataFrame): Tabela ponte de vendedores (ver pontes.py).
+
+    Returns:
+        dict: Posições ordenadas, chaves e códigos de ano, vendedor e fase.
+    """
+    # Códigos inteiros de cada dimensão (anos ausentes ficam com o código 0)
+    anos = pd.Categorical(base['Ano'])
+    codigo_ano = anos.codes.astype('int64') + 1
+    fases = base['Fase atual'].cat.categories
+    codigo_fase = base['Fase atual'].cat.codes.to_numpy().astype('int64') + 1
+    vendedores = ponte_vendedores['Vendedor'].cat.categories
+    total_fases, total_vendedores = len(fases) + 1, len(vendedores) + 1
+
+    chave_cards = codigo_ano * total_fases + codigo_fase
+    ordem_cards = np.argsort(chave_cards, kind='stable')
+
+    linhas = ponte_vendedores['linha'].to_numpy()
+    codigo_vendedor = ponte_vendedores['Vendedor'].cat.codes.to_numpy().astype('int64') + 1
+    chave_vendedores = (codigo_ano[linhas] * total_vendedores + codigo_vendedor) * total_fases + codigo_fase[linhas]
+    ordem_vendedores = np.argsort(chave_vendedores, kind='stable')
+
+    return {
+        'cards': ordem_cards,
+        'chaves_cards': chave_cards[ordem_cards],
+        'vendedores': linhas[ordem_vendedores],
+        'chaves_vendedores': chave_vendedores[ordem_vendedores],
+        'anos': list(anos.categories),
+        'fases': list(fases),
+        'nomes_vendedores': list(vendedores),
+        'total_fases': total_fases,
+        'total_vendedores': total_vendedores,
+    }
+
+def filtrar_base(ano=None, vendedor=None, fase=None, base_versao=None):
+    """
+    Filtra a base em cache por ano, vendedor e fase usando o índice (ver construir_indice).
+
+    Os intervalos de posições são encontrados por busca binária (searchsorted) nas chaves ordenadas,
+    sem percorrer a base; apenas as linhas dessas posições são copiadas da base.
+
+    Args:
+        ano (int): Ano do card (None para todos os anos).
+        vendedor (str): Nome curto do vendedor (None para todos os vendedores).
+        fase (str): Fase atual do card (None para todas as fases).
+        base_versao (tuple): (base, versão) obtidos por carregar_base_versao. Por padrão, usa a base em cache.
+
+    Returns:
+        DataFrame: Cards que atendem aos filtros. O índice (rótulos) é a posição de cada card na base. Com vendedor, a coluna 'Vendedor' traz o nome
+            curto do vendedor filtrado.
+    """
+    # O índice é construído sobre a mesma versão da base de que as linhas são obtidas
+    base_versao = base_versao or carregar_base_versao()
+    def construir(base):
+        return construir_indice(base, carregar_ponte('Vendedor', base_versao))
+    indice = carregar_tabela_derivada('indice', construir, [], base_versao)
+
+    def codigo(valor, valores):
+        # Código inteiro do valor (0 fica reservado para valores ausentes), ou None se o valor não existir
+        return valores.index(valor) + 1 if valor in valores else None
+
+    codigos_ano = [codigo(ano, indice['anos'])] if ano is not None else range(len(indice['anos']) + 1)
+    codigo_fase = codigo(fase, indice['fases']) if fase is not None else None
+    if vendedor is not None:
+        posicoes, chaves = indice['vendedores'], indice['chaves_vendedores']
+        codigo_vendedor = codigo(vendedor, indice['nomes_vendedores'])
+        prefixos = [c * indice['total_vendedores'] + codigo_vendedor for c in codigos_ano if c is not None and codigo_vendedor is not None]
+    else:
+        posicoes, chaves = indice['cards'], indice['chaves_cards']
+        prefixos = [c for c in codigos_ano if c is not None]
+
+    # Intervalo de chaves de cada prefixo: uma fase só, ou todas as fases do prefixo
+    intervalos = []
+    for prefixo in prefixos:
+        if fase is None:
+            inicio, fim = prefixo * indice['total_fases'], (prefixo + 1) * indice['total_fases']
+        elif codigo_fase is not None:
+            inicio = prefixo * indice['total_fases'] + codigo_fase
+            fim = inicio + 1
+        else:
+            continue
+        inicio, fim = np.searchsorted(chaves, [inicio, fim])
+        if fim > inicio:
+            intervalos.append((inicio, fim))
+
+    selecionadas = np.concatenate([posicoes[inicio:fim] for inicio, fim in intervalos] or [posicoes[0:0]])
+    fatia = base_versao[0].take(selecionadas)
+    if vendedor is not None:
+        fatia['Vendedor'] = pd.Categorical([vendedor] * len(fatia), categories=indice['nomes_vendedores'])
+    return fatia
+
+def normalizar_lead(nome):
+    # Nome do lead usado na busca: sem acentos, em minúsculas e sem espaços repetidos
+    return ' '.join(chave_nome(nome).split())
+
+def construir_indice_leads(base):
+    """
+    Constrói o índice de leads (empresas) da base, para a busca e a seleção de leads.
+
+    Cada lead recebe um código inteiro na ordem dos nomes normalizados (ver normalizar_lead), de modo
+    que os leads que começam com um mesmo texto têm códigos consecutivos. As posições dos cards de
+    cada lead ficam agrupadas em 'posicoes', entre 'inicios' e 'fins'.
+
+    Args:
+        base (DataFrame): Base pronta para uso nos dashboards.
+
+    Returns:
+        dict: Nomes normalizados e exibidos de cada lead, código do lead de cada card e posições dos cards.
+    """
+    empresas = pd.Categorical(base['Empresa'].astype('string[pyarrow]').str.strip().fillna(''))
+    chaves = np.array([normalizar_lead(nome) for nome in empresas.categories], dtype=str)
+    # Grafias com o mesmo nome normalizado são o mesmo lead; a primeira grafia é a exibida
+    chaves_leads, primeira_grafia, codigo_por_grafia = np.unique(chaves, return_index=True, return_inverse=True)
+    codigo_lead = codigo_por_grafia[empresas.codes]
+    # Empresas em branco não são leads
+    if len(chaves_leads) > 0 and chaves_leads[0] == '':
+        codigo_lead = codigo_lead - 1
+        chaves_leads, primeira_grafia = chaves_leads[1:], primeira_grafia[1:]
+
+    posicoes = np.argsort(codigo_lead, kind='stable')
+    codigos_ordenados = codigo_lead[posicoes]
+    codigos = np.arange(len(chaves_leads))
+    nomes = np.asarray(empresas.categories, dtype=object)[primeira_grafia]
+
+    # Índice invertido de trigramas (sequências de três letras) para a busca aproximada
+    trigramas = {}
+    for codigo, chave in enumerate(chaves_leads):
+        for trigrama in trigramas_lead(chave):
+            trigramas.setdefault(trigrama, []).append(codigo)
+    return {
+        'chaves': chaves_leads,
+        'nomes': nomes,
+        'codigo_por_nome': {nome: codigo for codigo, nome in enumerate(nomes)},
+        'codigo_lead': codigo_lead,
+        'posicoes': posicoes,
+        'inicios': np.searchsorted(codigos_ordenados, codigos, side='left'),
+        'fins': np.searchsorted(codigos_ordenados, codigos, side='right'),
+        'trigramas': {trigrama: np.array(lista, dtype='int64') for trigrama, lista in trigramas.items()},
+    }
+
+def trigramas_lead(chave):
+    # Trigramas distintos do nome normalizado (com espaços nas pontas, para valorizar o começo e o fim)
+    chave = f'  {chave} '
+    return {chave[i:i + 3] for i in range(len(chave) - 2)}
+
+def carregar_indice_leads(base_versao=None):
+    # Índice de leads da versão da base (construído uma única vez por versão)
+    return carregar_tabela_derivada('indice_leads', construir_indice_leads, [], base_versao)
+
+def buscar_leads(texto, posicoes, limite=LIMITE_LEADS):
+    """
+    Busca os leads entre os cards informados, pelo começo do nome ou, se nenhum começar com o texto, por semelhança.
+
+    Args:
+        texto (str): Texto digitado ('' para todos os leads).
+        posicoes (array): Posições na base dos cards considerados (ex.: índice de uma fatia de filtrar_base).
+        limite (int): Quantidade máxima de leads retornados.
+
+    Returns:
+        list: Nomes dos leads encontrados, em ordem alfabética (ou de semelhança, na busca aproximada).
+    """
+    indice = carregar_indice_leads()
+    # Posições obtidas de uma versão anterior da base podem não existir na versão atual
+    posicoes = np.asarray(posicoes, dtype='int64')
+    posicoes = posicoes[posicoes < len(indice['codigo_lead'])]
+    permitidos = np.unique(indice['codigo_lead'][posicoes])
+    permitidos = permitidos[permitidos >= 0]
+    chave = normalizar_lead(texto)
+    if chave:
+        # Os leads que começam com o texto formam um intervalo de códigos
+        inicio, fim = np.searchsorted(indice['chaves'], [chave, chave + '\uffff'])
+        encontrados = permitidos[(permitidos >= inicio) & (permitidos < fim)]
+        if len(encontrados) == 0:
+            encontrados = buscar_leads_semelhantes(indice, chave, permitidos, limite)
+        permitidos = encontrados
+    return indice['nomes'][permitidos[:limite]].tolist()
+
+def buscar_leads_semelhantes(indice, chave, permitidos, limite):
+    # Pré-seleciona os leads com mais trigramas em comum com o texto (pelo índice invertido)
+    # e ordena os melhores pela semelhança calculada pelo difflib
+    pontos = np.zeros(len(indice['chaves']), dtype='int64')
+    for trigrama in trigramas_lead(chave):
+        codigos = indice['trigramas'].get(trigrama)
+        if codigos is not None:
+            pontos[codigos] += 1
+    pontos_permitidos = pontos[permitidos]
+    candidatos = permitidos[np.argsort(-pontos_permitidos, kind='stable')[:limite * 4]]
+    candidatos = candidatos[pontos[candidatos] > 0]
+    semelhantes = get_close_matches(chave, indice['chaves'][candidatos].tolist(), n=limite, cutoff=0.6)
+    return np.searchsorted(indice['chaves'], semelhantes)
+
+def dados_lead(nome, posicoes):
+    """
+    Obtém os cards de um lead entre os cards informados, pelas posições guardadas no índice de leads.
+
+    Args:
+        nome (str): Nome do lead (como retornado por buscar_leads).
+        posicoes (array): Posições na base dos cards considerados.
+
+    Returns:
+        DataFrame: Cards do lead (vazio se o lead não existir).
+    """
+    # O índice e os cards vêm da mesma versão da base
+    base_versao = carregar_base_versao()
+    indice = carregar_indice_leads(base_versao)
+    base = base_versao[0]
+    codigo = indice['codigo_por_nome'].get(nome)
+    if codigo is None:
+        return base.iloc[0:0]
+    linhas = indice['posicoes'][indice['inicios'][codigo]:indice['fins'][codigo]]
+    return base.take(linhas[np.isin(linhas, posicoes)])
+
+def carregar_base_fonte(consultar_planilha=False):
+    """
+    Obtém a versão atual da base pela memória compartilhada entre os processos da máquina.
+
+    Se a versão publicada estiver atualizada, apenas a mapeia (ver dataset_compartilhado.py). Caso contrário,
+    um único processo lê a base da fonte e publica a nova versão; os demais esperam e a mapeiam.
+
+    Args:
+        consultar_planilha (bool): Se a versão publicada pelo ETL na planilha deve ser conferida. Por padrão,
+            a planilha só é consultada quando não há versão na máquina (memória compartilhada ou snapshot).
+
+    Returns:
+        tuple: (DataFrame pronto para uso nos dashboards, versão dos dados).
+    """
+    compartilhada = anexar_dataset()
+    versao_planilha = None
+    if consultar_planilha or (compartilhada is None and ler_manifesto() is None):
+        versao_planilha = versao_publicada()
+    if compartilhada is not None and dataset_atualizado(compartilhada[1], versao_planilha):
+        return compartilhada[0], compartilhada[1]['versao']
+
+    with trava_carga():
+        # Outro processo pode ter publicado a versão nova enquanto este esperava a trava
+        compartilhada = anexar_dataset()
+        if compartilhada is not None and dataset_atualizado(compartilhada[1], versao_planilha):
+            return compartilhada[0], compartilhada[1]['versao']
+        df, versao = ler_base_fonte(versao_planilha)
+        publicar_dataset(df, versao)
+
+    compartilhada = anexar_dataset()
+    if compartilhada is not None and compartilhada[1]['versao'] == versao:
+        return compartilhada[0], versao
+    return df, versao
+
+def dataset_atualizado(ponteiro, versao_planilha=None):
+    # A versão compartilhada está atualizada se for a publicada pelo ETL na planilha (ou, sem ela, a do
+    # snapshot local; sem nenhum dos dois, se estiver dentro do TTL)
+    if versao_planilha is not None:
+        return ponteiro['versao'] == versao_planilha
+    manifesto = ler_manifesto()
+    if manifesto is not None:
+        return ponteiro['versao'] == manifesto['versao']
+    return time.time() - ponteiro['publicado_em'] < TTL_BASE
+
+def ler_base_fonte(versao_planilha=None):
+    """
+    Lê a base da fonte, sem cache.
+
+    Usa o snapshot local (lido por memory map, já com o schema aplicado) se ele estiver na versão
+    publicada pelo ETL na planilha. Caso contrário, lê a aba 'Upload' do Google Sheets e grava um
+    snapshot local dessa versão, com o cubo e as tabelas ponte, que passa a ser lido pelos outros
+    processos da máquina e depois de reinícios.
+
+    Args:
+        versao_planilha (str): Versão publicada pelo ETL (ver versao_publicada), ou None se não houver.
+
+    Returns:
+        tuple: (DataFrame pronto para uso nos dashboards, versão dos dados).
+    """
+    snapshot = carregar_snapshot()
+    if snapshot is not None and versao_planilha in (None, snapshot[1]['versao']):
+        df, manifesto = snapshot
+        return preparar_para_dashboard(df), manifesto['versao']
+
+    df = ler_aba_upload()
+    base = preparar_para_dashboard(df)
+    if versao_planilha is None:
+        # Sem versão publicada, a versão é derivada do conteúdo lido da planilha
+        versao = 'sheets-' + format(int(pd.util.hash_pandas_object(base, index=False).sum()), 'x')
+        return base, versao
+    publicar_snapshot(df, extras=construir_tabelas_derivadas(base), versao=versao_planilha)
+    return base, versao_planilha
+
+def versao_publicada():
+    """
+    Lê a versão dos dados publicada pelo ETL na aba ABA_VERSAO da planilha.
+
+    Returns:
+        str: Versão publicada, ou None se a aba não existir ou não puder ser lida.
+    """
+    try:
+        return abrir_planilha().worksheet(ABA_VERSAO).acell('A2').value or None
+    except Exception as e:
+        print(f"Não foi possível ler a versão publicada na planilha: {e}")
+        return None
+
+def abrir_planilha():
+    # Abre a planilha do CRM com as credenciais da conta de serviço
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
 
     try:
@@ -21,44 +516,86 @@ def carregar_base():
     SheetsID = st.secrets['SHEETS_ID']
     
     # Abre a planilha
-    sheet = client.open_by_key(SheetsID)
-    worksheet = sheet.worksheet('Upload')
+    return client.open_by_key(SheetsID)
+
+def ler_aba_upload():
+    # Lê a aba 'Upload' com os nomes de colunas e os tipos do ETL (ver schema.aplicar_schema)
+    worksheet = abrir_planilha().worksheet('Upload')
 
     # Lê os dados
     data = worksheet.get_all_values()
     headers = data.pop(0)
     df = pd.DataFrame(data, columns=headers)
 
-    df['Valor Final'] = pd.to_numeric(df['Valor Final'], errors='coerce')
-    df['Criado em'] = pd.to_datetime(df['Criado em'], errors='coerce')
-    df['Primeira vez que entrou na fase Ganho'] = pd.to_datetime(df['Primeira vez que entrou na fase Ganho'], errors='coerce')
-    df['Ano'] = df['Criado em'].dt.year
-    df.rename(columns={'Responsável': 'Vendedor'}, inplace=True)
-    df.rename(columns={'Checklist vertical': 'Serviço'}, inplace=True)
     # Remover colunas sem nome ou colunas com nomes vazios
     df = df.loc[:, ~df.columns.str.match('^Unnamed')]
     df = df.loc[:, df.columns != '']
-    
-    colunas_tempo = definir_colunas_tempo()
-    
-    # Converter as colunas de tempo para float
-    df[colunas_tempo] = df[colunas_tempo].apply(pd.to_numeric, errors='coerce')
-    
-    return df
+
+    # Aplicar os tipos do schema da base (categorias, números e datas)
+    return aplicar_schema(df)
+
+def carregar_base_sheets():
+    # Lê a aba 'Upload', renomeia as colunas usadas nos dashboards ('Vendedor' e 'Serviço') e cria a coluna 'Ano'
+    return preparar_para_dashboard(ler_aba_upload())
+
+def memorizar(funcao):
+    """
+    Memoriza os resultados de uma função dos dashboards pela versão dos dados e pelos parâmetros.
+
+    A chave é (versão dos dados, função, parâmetros). As funções memorizadas recebem os filtros como
+    parâmetros (ex.: ano e vendedor) e a base pelo parâmetro base_versao (ver carregar_base_versao):
+    se ele não for informado, a base e a sua versão são obtidas uma única vez aqui, e a mesma base
+    usada no cálculo é a da versão que entra na chave. Chamadas com DataFrames ou outros parâmetros
+    que não podem entrar na chave são executadas sem memorização. Os resultados menos usados
+    recentemente são descartados quando o limite TAMANHO_MEMO é atingido.
+
+    Args:
+        funcao (callable): Função que depende apenas da base e dos parâmetros, com o parâmetro base_versao.
+
+    Returns:
+        callable: Função com memorização.
+    """
+    @wraps(funcao)
+    def funcao_memorizada(*args, **kwargs):
+        if kwargs.get('base_versao') is None:
+            kwargs['base_versao'] = carregar_base_versao()
+        chave = chave_memo(funcao, args, kwargs)
+        if chave is None:
+            return funcao(*args, **kwargs)
+        with _lock_memo:
+            if chave in _memo:
+                _memo.move_to_end(chave)
+                return copiar_resultado(_memo[chave])
+        resultado = funcao(*args, **kwargs)
+        with _lock_memo:
+            _memo[chave] = resultado
+            while len(_memo) > TAMANHO_MEMO:
+                _memo.popitem(last=False)
+        return copiar_resultado(resultado)
+    return funcao_memorizada
+
+def copiar_resultado(resultado):
+    # Cópia rasa dos DataFrames, para que as páginas possam alterá-los sem alterar o que foi memorizado
+    return resultado.copy(deep=False) if isinstance(resultado, pd.DataFrame) else resultado
+
+def chave_memo(funcao, args, kwargs):
+    # Monta a chave de memorização, ou None se algum parâmetro não puder entrar na chave. DataFrames nunca
+    # entram: sem calcular o hash dos dados, nada identifica as linhas que eles contêm. A versão é a da base
+    # recebida em base_versao, que fica fora dos parâmetros da chave
+    versao = kwargs['base_versao'][1]
+    nomeados = tuple(sorted((nome, valor) for nome, valor in kwargs.items() if nome != 'base_versao'))
+    if any(isinstance(valor, pd.DataFrame) for valor in args + tuple(valor for _, valor in nomeados)):
+        return None
+    chave = (versao, funcao.__module__, funcao.__qualname__, args, nomeados)
+    try:
+        hash(chave)
+    except TypeError:
+        return None
+    return chave
 
 # Lista das colunas de tempo
 def definir_colunas_tempo():
-    colunas_tempo = [
-        'Tempo total na fase Base de prospects (dias)',
-        'Tempo total na fase Qualificação (dias)',
-        'Tempo total na fase Diagnóstico (dias)',
-        'Tempo total na fase Montagem de proposta (dias)',
-        'Tempo total na fase Apresentação de proposta (dias)',
-        'Tempo total na fase Negociação (dias)',
-        'Tempo total na fase Renegociação (dias)'
-    ]
-    
-    return colunas_tempo
+    return list(COLUNAS_TEMPO)
 
 def calcular_taxa_conversao(base):
     """
@@ -70,73 +607,218 @@ def calcular_taxa_conversao(base):
     Returns:
         float: Taxa de conversão calculada.
     """
-    total_vendas_ganhas = len(base[base['Fase atual'] == 'Ganho'])
-    total_oportunidades = len(base)
-    taxa_conversao = (total_vendas_ganhas / total_oportunidades) * 100 if total_oportunidades > 0 else 0
-    return taxa_conversao
+    return calcular_metricas(base, [])['taxa_conversao'].iloc[0]
+
+@memorizar
+def preparar_dados_faturamento(ano=None, vendedor=None, granularidade='D', max_pontos=MAX_PONTOS_GRAFICO, base_versao=None):
+    """
+    Prepara os dados para o gráfico de faturamento acumulado das vendas ganhas.
+
+    O faturamento é somado por período ('D' dia, 'W' semana ou 'MS' mês) e, se ainda houver mais
+    de max_pontos períodos, a curva acumulada é reduzida com reduzir_pontos, mantendo o seu formato.
+
+    Args:
+        ano (int): Ano das vendas (None para todos os anos).
+        vendedor (str): Nome curto do vendedor (None para todos os vendedores).
+        granularidade (str): Período de agrupamento ('D', 'W' ou 'MS').
+        max_pontos (int): Quantidade máxima de pontos enviados ao gráfico.
+        base_versao (tuple): (base, versão) obtidos por carregar_base_versao (informado por memorizar).
+
+    Returns:
+        DataFrame: DataFrame com 'Criado em' e 'Faturamento Acumulado' (somente vendas ganhas).
+    """
+    base_ganhos = filtrar_base(ano=ano, vendedor=vendedor, fase='Ganho', base_versao=base_versao)
+    base_faturamento = calcular_metricas(base_ganhos, ['Criado em']).dropna(subset=['Criado em'])
+    faturamento = base_faturamento.set_index('Criado em')['faturamento'].resample(granularidade).sum()
+    base_faturamento = pd.DataFrame({
+        'Criado em': faturamento.index,
+        'Faturamento Acumulado': faturamento.cumsum().to_numpy(),
+    })
+    return reduzir_pontos(base_faturamento, 'Criado em', 'Faturamento Acumulado', max_pontos)
 
-def preparar_dados_faturamento(base_filtrada):
+def reduzir_pontos(dados, coluna_x, coluna_y, max_pontos):
     """
-    Prepara os dados para o gráfico de faturamento acumulado.
+    Reduz a quantidade de pontos de uma série para desenhá-la, preservando o seu formato (algoritmo LTTB).
+
+    A série é dividida em max_pontos - 2 faixas; de cada faixa é mantido o ponto que forma o maior
+    triângulo com o ponto escolhido na faixa anterior e a média da faixa seguinte. O primeiro e o
+    último ponto são sempre mantidos.
 
     Args:
-        base_filtrada (DataFrame): DataFrame com os dados filtrados.
+        dados (DataFrame): Série ordenada por coluna_x.
+        coluna_x (str): Coluna do eixo X (número ou data).
+        coluna_y (str): Coluna do eixo Y.
+        max_pontos (int): Quantidade máxima de pontos.
 
     Returns:
-        DataFrame: DataFrame com 'Criado em' e 'Faturamento Acumulado'.
+        DataFrame: Linhas mantidas da série.
     """
-    base_faturamento = base_filtrada.groupby('Criado em')['Valor Final'].sum().reset_index()
-    base_faturamento = base_faturamento.sort_values('Criado em')
-    base_faturamento['Faturamento Acumulado'] = base_faturamento['Valor Final'].cumsum()
-    return base_faturamento[['Criado em', 'Faturamento Acumulado']]
+    total = len(dados)
+    if max_pontos is None or total <= max_pontos or max_pontos < 3:
+        return dados
+    x = dados[coluna_x].to_numpy().astype('int64').astype('float64')
+    y = dados[coluna_y].to_numpy(dtype='float64')
+
+    # Limites das faixas (o primeiro e o último ponto ficam fora delas)
+    limites = np.linspace(1, total - 1, max_pontos - 1).astype('int64')
+    escolhidos = np.empty(max_pontos, dtype='int64')
+    escolhidos[0], escolhidos[-1] = 0, total - 1
+    anterior = 0
+    for i in range(max_pontos - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        # Média da faixa seguinte (na última faixa, o último ponto)
+        seguinte_inicio, seguinte_fim = fim, limites[i + 2] if i + 2 < len(limites) else total
+        media_x = x[seguinte_inicio:seguinte_fim].mean()
+        media_y = y[seguinte_inicio:seguinte_fim].mean()
+        # Área (em dobro) dos triângulos formados por cada ponto da faixa
+        areas = np.abs((x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior]))
+        anterior = inicio + int(areas.argmax())
+        escolhidos[i + 1] = anterior
+    return dados.iloc[escolhidos].reset_index(drop=True)
 
-def preparar_dados_analise_vendas(base_filtrada, metrica, categoria):
+@memorizar
+def preparar_dados_analise_vendas(metrica, categoria, ano=None, base_versao=None):
     """
-    Prepara os dados para o gráfico de análise de vendas.
+    Prepara os dados para o gráfico de análise de vendas (somente vendas ganhas).
 
     Args:
-        base_filtrada (DataFrame): DataFrame com os dados filtrados.
         metrica (str): Métrica selecionada ('Quantidade' ou 'Faturamento').
         categoria (str): Categoria selecionada para agrupamento.
+        ano (int): Ano selecionado (None para todos os anos).
+        base_versao (tuple): (base, versão) obtidos por carregar_base_versao (informado por memorizar).
 
     Returns:
         DataFrame: DataFrame preparado para o gráfico.
     """
-    # Usamos uma cópia do DataFrame original para evitar alterações indesejadas
-    df = base_filtrada.copy()
-
-    # Aplicamos a lógica de dividir e explodir apenas se a categoria for 'Serviço'
-    # e se estivermos calculando a 'Quantidade', para não afetar o 'Faturamento' ou outros cálculos
+    # Usamos o cubo com um serviço por linha apenas se a categoria for 'Serviço' e se estivermos
+    # calculando a 'Quantidade', para não afetar o 'Faturamento' ou outros cálculos
     if categoria == 'Serviço' and metrica == 'Quantidade':
-        # Dividir os serviços separados por vírgula em listas
-        df['Serviço'] = df['Serviço'].str.split(', ')
-        # Explodir a coluna 'Serviço' para que cada serviço tenha sua própria linha
-        df = df.explode('Serviço')
+        cubo = carregar_cubo('Serviço', base_versao)
+    else:
+        cubo = carregar_cubo(base_versao=base_versao)
 
-    # Agrupamos e agregamos os dados de acordo com a métrica selecionada
+    # Agrupamos o cubo do ano pela categoria, mantendo apenas as categorias com vendas ganhas
+    base_agrupado = agregar_cubo(fatiar_cubo(cubo, Ano=ano), [categoria])
+    base_agrupado = base_agrupado[base_agrupado['ganhos'] > 0]
     if metrica == 'Quantidade':
-        base_agrupado = df.groupby(categoria).size().reset_index(name='Quantidade')
+        base_agrupado = base_agrupado.rename(columns={'ganhos': 'Quantidade'})
     else:
-        base_agrupado = df.groupby(categoria)['Valor Final'].sum().reset_index()
-        base_agrupado.rename(columns={'Valor Final': 'Faturamento'}, inplace=True)
+        base_agrupado = base_agrupado.rename(columns={'faturamento': 'Faturamento'})
 
-    return base_agrupado
+    return base_agrupado[[categoria, metrica]]
 
 
-def preparar_dados_metricas_vendedores(base_filtrada, metrica):
+@memorizar
+def preparar_dados_metricas_vendedores(metrica, ano=None, base_versao=None):
     """
-    Prepara os dados para o gráfico de metricas de vendedores.
+    Prepara os dados para o gráfico de metricas de vendedores (somente vendas ganhas).
 
     Args:
-        base_filtrada (DataFrame): DataFrame com os dados filtrados.
+        metrica (str): Métrica selecionada ('Quantidade' ou 'Faturamento').
+        ano (int): Ano selecionado (None para todos os anos).
+        base_versao (tuple): (base, versão) obtidos por carregar_base_versao (informado por memorizar).
 
     Returns:
-        DataFrame: DataFrame com 'Vendedor' e 'Faturamento'.
+        DataFrame: DataFrame com 'Vendedor' e a métrica selecionada.
     """
+    base_metricas = agregar_cubo(fatiar_cubo(carregar_cubo('Vendedor', base_versao), Ano=ano), ['Vendedor'])
+    base_metricas = base_metricas[base_metricas['ganhos'] > 0]
     if metrica == 'Quantidade':
-        base_metricas = base_filtrada.groupby('Vendedor').size().reset_index(name='Quantidade')
+        base_metricas = base_metricas.rename(columns={'ganhos': 'Quantidade'})
     else:
-        base_metricas = base_filtrada.groupby('Vendedor')['Valor Final'].sum().reset_index()
-        base_metricas.rename(columns={'Valor Final': 'Faturamento'}, inplace=True)
+        base_metricas = base_metricas.rename(columns={'faturamento': 'Faturamento'})
         base_metricas = base_metricas.sort_values('Faturamento', ascending=False)
-    return base_metricas
+    return base_metricas[['Vendedor', metrica]]
+
+
+# Colunas exibidas por padrão na tabela paginada
+COLUNAS_TABELA = ['Nome do cliente', 'Empresa', 'Fase atual', 'Vendedor', 'Serviço', 'Origem', 'Valor Final', 'Criado em']
+LINHAS_POR_PAGINA = 50
+
+@memorizar
+def ordenar_filtrar_base(coluna_filtro, texto, coluna_ordem, crescente, base_versao=None):
+    """
+    Calcula as posições das linhas da base que contêm o texto na coluna de filtro, na ordem pedida.
+
+    Args:
+        coluna_filtro (str): Coluna onde o texto é procurado.
+        texto (str): Texto procurado, sem diferenciar maiúsculas e minúsculas ('' para todas as linhas).
+        coluna_ordem (str): Coluna usada na ordenação.
+        crescente (bool): Se a ordenação é crescente.
+        base_versao (tuple): (base, versão) obtidos por carregar_base_versao, a que as posições se referem
+            (informado por memorizar, se não for passado).
+
+    Returns:
+        ndarray: Posições das linhas na base.
+    """
+    base, _ = base_versao
+    posicoes = np.arange(len(base))
+    if texto:
+        valores = base[coluna_filtro].astype('string[pyarrow]')
+        encontrados = valores.str.contains(texto, case=False, regex=False)
+        posicoes = posicoes[encontrados.to_numpy(dtype=bool, na_value=False)]
+    # Valores ausentes ficam no fim, em qualquer ordem
+    ordem = base[coluna_ordem].take(posicoes).reset_index(drop=True).sort_values(ascending=crescente, kind='stable', na_position='last')
+    return posicoes[ordem.index.to_numpy()]
+
+def paginar_base(colunas, coluna_filtro, texto, coluna_ordem, crescente, pagina, linhas_por_pagina=LINHAS_POR_PAGINA):
+    """
+    Obtém uma página da base filtrada e ordenada, apenas com as colunas pedidas.
+
+    Args:
+        colunas (list): Colunas exibidas.
+        coluna_filtro (str): Coluna onde o texto é procurado.
+        texto (str): Texto procurado ('' para todas as linhas).
+        coluna_ordem (str): Coluna usada na ordenação.
+        crescente (bool): Se a ordenação é crescente.
+        pagina (int): Número da página, começando em 1.
+        linhas_por_pagina (int): Quantidade de linhas por página.
+
+    Returns:
+        tuple: (DataFrame da página, total de linhas encontradas).
+    """
+    # As posições são calculadas e usadas na mesma versão da base, mesmo que outra seja carregada entre os dois passos
+    base_versao = carregar_base_versao()
+    posicoes = ordenar_filtrar_base(coluna_filtro, texto, coluna_ordem, crescente, base_versao=base_versao)
+    inicio = (pagina - 1) * linhas_por_pagina
+    return base_versao[0][colunas].take(posicoes[inicio:inicio + linhas_por_pagina]), len(posicoes)
+
+def exibir_tabela_paginada(chave='tabela'):
+    """
+    Exibe a base em uma tabela paginada, filtrada e ordenada no servidor.
+
+    Apenas a página visível, com as colunas escolhidas, é enviada ao navegador. Nada é calculado
+    nem enviado enquanto a opção de exibir a tabela estiver desligada.
+
+    Args:
+        chave (str): Prefixo das chaves dos widgets (para mais de uma tabela na mesma página).
+    """
+    if not st.toggle("Exibir tabela", key=f'{chave}_exibir'):
+        return
+    base = carregar_base()
+    todas_colunas = list(base.columns)
+
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        colunas = st.multiselect("Colunas", todas_colunas, default=[c for c in COLUNAS_TABELA if c in todas_colunas], key=f'{chave}_colunas')
+    with col2:
+        coluna_filtro = st.selectbox("Filtrar coluna", todas_colunas, index=todas_colunas.index('Empresa') if 'Empresa' in todas_colunas else 0, key=f'{chave}_coluna_filtro')
+        texto = st.text_input("Contém", key=f'{chave}_texto')
+    with col3:
+        coluna_ordem = st.selectbox("Ordenar por", todas_colunas, index=todas_colunas.index('Criado em') if 'Criado em' in todas_colunas else 0, key=f'{chave}_coluna_ordem')
+        crescente = st.toggle("Crescente", value=False, key=f'{chave}_crescente')
+    with col4:
+        # A página é limitada ao total de páginas na próxima execução
+        pagina = st.number_input("Página", min_value=1, value=1, step=1, key=f'{chave}_pagina')
+
+    if not colunas:
+        st.info("Selecione ao menos uma coluna.")
+        return
+    pagina_atual, total = paginar_base(colunas, coluna_filtro, texto.strip(), coluna_ordem, crescente, int(pagina))
+    total_paginas = max(1, -(-total // LINHAS_POR_PAGINA))
+    if pagina > total_paginas:
+        pagina_atual, total = paginar_base(colunas, coluna_filtro, texto.strip(), coluna_ordem, crescente, total_paginas)
+        pagina = total_paginas
+    st.dataframe(pagina_atual, hide_index=True, use_container_width=True)
+    st.caption(f"Página {int(pagina)} de {total_paginas} ({total} linhas)")